@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from resilience import UpstreamUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# Sustained weather requests per second each client may make, on top of a burst
+# allowance; 0 disables per-client limiting
+CLIENT_RATE_PER_SECOND = float(os.getenv('CLIENT_RATE_PER_SECOND', '1'))
+CLIENT_BURST = float(os.getenv('CLIENT_BURST', '20'))
+CLIENT_BUCKETS_MAX = int(os.getenv('CLIENT_BUCKETS_MAX', '10000'))
+# Behind a proxy (Render) every request comes from the proxy's address. Set this
+# to the number of proxies in front of us to identify clients by X-Forwarded-For
+# instead; 0 ignores the header (nothing trusted appends to it)
+FORWARDED_FOR_HOPS = int(os.getenv('FORWARDED_FOR_HOPS', '0'))
+
+# Overload mode drops AI and YouTube enrichments so the core weather payload
+# keeps its latency. It turns on when this many weather requests are in flight,
+# or when upstream limiters shed OVERLOAD_SHED_THRESHOLD calls made for users
+# within OVERLOAD_SHED_WINDOW seconds, and stays on OVERLOAD_HOLD_SECONDS after
+# the last trigger.
+OVERLOAD_IN_FLIGHT = int(os.getenv('OVERLOAD_IN_FLIGHT', '100'))
+OVERLOAD_SHED_THRESHOLD = int(os.getenv('OVERLOAD_SHED_THRESHOLD', '5'))
+OVERLOAD_SHED_WINDOW = float(os.getenv('OVERLOAD_SHED_WINDOW', '10'))
+OVERLOAD_HOLD_SECONDS = float(os.getenv('OVERLOAD_HOLD_SECONDS', '15'))
+
+# True while running prefetch or other work no user is waiting for
+_background: ContextVar[bool] = ContextVar('background', default=False)
+
+
+class UpstreamOverloadedError(UpstreamUnavailableError):
+    """Raised instead of queueing for an upstream that is at its concurrency limit."""
+
+
+@contextmanager
+def background_work(background: bool = True):
+    """Marks upstream calls made inside the block (and tasks started from it)
+    as background work, whose sheds don't count toward overload mode."""
+    token = _background.set(background)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class ClientRateLimiter:
+    """Token bucket per client. Buckets for the least recently seen clients are
+    dropped past CLIENT_BUCKETS_MAX (they simply start over with a full burst)."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict = OrderedDict()  # client -> (tokens, updated_at)
+
+    def acquire(self, client: str, cost: float = 1.0) -> float:
+        """Takes `cost` tokens. Returns 0 when admitted, otherwise the seconds
+        until enough tokens will have accumulated (nothing is taken then)."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        # A batch larger than the burst can still go through on a full bucket
+        cost = min(cost, self.burst)
+        if tokens < cost:
+            self._buckets[client] = (tokens, now)
+            self._buckets.move_to_end(client)
+            return (cost - tokens) / self.rate
+        self._buckets[client] = (tokens - cost, now)
+        self._buckets.move_to_end(client)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return 0.0
+
+
+class UpstreamLimiter:
+    """Caps concurrent calls to one upstream. Callers wait at most queue_timeout
+    for a slot and are then shed, instead of piling up until the HTTP timeout."""
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        if self._semaphore.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                load.record_shed("upstream_limit", self.name)
+                raise UpstreamOverloadedError(
+                    f"{self.name} is at its limit of {self.limit} concurrent calls; shedding"
+                ) from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def spare_slot(self):
+        """A slot only if one is free right now, for optional extra calls such
+        as hedges: they are refused at once and don't count as shed."""
+        if self._semaphore.locked():
+            raise UpstreamOverloadedError(f"No spare {self.name} slot for an optional call")
+        async with self:
+            yield self
+
+    def stats(self) -> dict:
+        return {'limit': self.limit, 'active': self.active, 'waiting': self.waiting}
+
+
+class LoadMonitor:
+    """Tracks in-flight API requests and shed counts, and decides when the
+    service is in overload mode."""
+
+    def __init__(self, in_flight_threshold: int, hold_seconds: float,
+                 shed_threshold: int = OVERLOAD_SHED_THRESHOLD, shed_window: float = OVERLOAD_SHED_WINDOW):
+        self.in_flight_threshold = in_flight_threshold
+        self.hold_seconds = hold_seconds
+        self.shed_threshold = shed_threshold
+        self.shed_window = shed_window
+        self.in_flight = 0
+        self.shed: dict[tuple[str, str], int] = {}  # (reason, target) -> count
+        self._recent_sheds: deque = deque()  # monotonic times of foreground upstream sheds
+        self._overloaded_until = 0.0
+
+    def request_started(self):
+        self.in_flight += 1
+        if self.in_flight >= self.in_flight_threshold:
+            self._trigger(f"{self.in_flight} requests in flight")
+
+    def request_finished(self):
+        self.in_flight -= 1
+
+    def record_shed(self, reason: str, target: str):
+        self.shed[(reason, target)] = self.shed.get((reason, target), 0) + 1
+        # Clients being rate limited is their problem, not a sign we're overloaded,
+        # and background work being shed is the limiter protecting users
+        if reason != "upstream_limit" or _background.get():
+            return
+        now = time.monotonic()
+        self._recent_sheds.append(now)
+        while self._recent_sheds[0] < now - self.shed_window:
+            self._recent_sheds.popleft()
+        if len(self._recent_sheds) >= self.shed_threshold:
+            self._trigger(f"{len(self._recent_sheds)} upstream calls shed in {self.shed_window:.0f}s, last by {target}")
+
+    def _trigger(self, cause: str):
+        now = time.monotonic()
+        if now >= self._overloaded_until:
+            logger.warning(f"Entering overload mode ({cause}); AI and YouTube enrichments are skipped.")
+        self._overloaded_until = now + self.hold_seconds
+
+    def overloaded(self) -> bool:
+        return time.monotonic() < self._overloaded_until
+
+
+class LoadTrackingMiddleware:
+    """Counts weather requests in flight for the LoadMonitor; metrics scrapes,
+    health checks and the like don't count. Plain ASGI rather than
+    BaseHTTPMiddleware, which returns as soon as the response headers are sent,
+    so SSE streams stay counted until their last event."""
+
+    def __init__(self, app, monitor: LoadMonitor | None = None, path_prefix: str = "/api/weather"):
+        self.app = app
+        self.monitor = monitor
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        monitor = self.monitor or load
+        monitor.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            monitor.request_finished()
+
+
+def client_id(headers, host: str | None, hops: int | None = None) -> str:
+    """The address the rate limit is keyed on. Each proxy appends the address it
+    received the request from to X-Forwarded-For, so only the last `hops` entries
+    are trustworthy; anything to their left was sent by the client."""
+    hops = FORWARDED_FOR_HOPS if hops is None else hops
+    if hops > 0:
+        entries = [
+            entry.strip()
+            for value in headers.getlist("x-forwarded-for")
+            for entry in value.split(",")
+            if entry.strip()
+        ]
+        if entries:
+            # Fewer entries than hops: the request skipped an outer proxy, and
+            # the leftmost entry was still added by one of ours
+            return entries[max(0, len(entries) - hops)]
+    return host or "unknown"
+
+
+load = LoadMonitor(OVERLOAD_IN_FLIGHT, OVERLOAD_HOLD_SECONDS)
+clients = ClientRateLimiter(CLIENT_RATE_PER_SECOND, CLIENT_BURST, CLIENT_BUCKETS_MAX)
@@ -1,18 +1,91 @@
+import asyncio
+import logging
 import httpx
 import os
 import json
+import re
+from bisect import bisect_right
+from cache import make_cache
+from http_client import request as upstream_request
+from llm_dispatcher import INTERACTIVE, dispatcher
+from metrics import stage_timer
+from weather_model import DaySummary, WeatherReport
 
-OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
+logger = logging.getLogger(__name__)
+
+OPENROUTER_CHAT_PATH = "/api/v1/chat/completions" # Host lives in http_client.UPSTREAM_PROFILES
 MODEL_NAME = "openai/gpt-4o-mini" # Specify the desired model
 YOUR_SITE_URL = "http://localhost:8000" # Replace with your actual site URL if deployed
 YOUR_APP_NAME = "WeatherWise" # Or your app's name
 
-async def get_llm_response(prompt: str, system_prompt: str = "You are a helpful assistant.") -> str | None:
-    """Sends a prompt to the OpenRouter API and returns the text response."""
+# --- Insight Cache ---
+# Insights for near-identical weather are interchangeable, so responses are cached
+# on bucketed prompt features rather than the exact readings.
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2000"))
+WIND_BANDS_KPH = [2, 6, 12, 20, 29, 39, 50, 62, 75, 89, 103, 118] # Beaufort scale boundaries
+
+_insight_cache = make_cache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, name="llm")
+
+def _bucket_value(name: str, value):
+    """Maps a single prompt feature onto its cache bucket."""
+    if isinstance(value, dict):
+        return {k: _bucket_value(k, v) for k, v in sorted(value.items())}
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().casefold()
+    if not isinstance(value, (int, float)):
+        return value
+    if "wind" in name:
+        return f"band{bisect_right(WIND_BANDS_KPH, value)}"
+    if "temp" in name or "feels_like" in name:
+        return round(value)
+    if "humidity" in name or "chance" in name:
+        return int(round(value, -1))
+    return value
+
+def insight_cache_key(kind: str, prompt_data: dict) -> str:
+    return f"{kind}:{json.dumps(_bucket_value(kind, prompt_data), sort_keys=True)}"
+
+async def get_cached_llm_response(kind: str, prompt_data: dict, prompt: str, system_prompt: str,
+                                  priority: int = INTERACTIVE) -> str | None:
+    """get_llm_response behind the insight cache. Failed calls are not cached."""
+    key = insight_cache_key(kind, prompt_data)
+    cached = await _insight_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def store(text: str):
+        await _insight_cache.set(key, text)
+
+    with stage_timer(f"llm_{kind}"):
+        return await get_llm_response(prompt, system_prompt, priority=priority, on_text=store)
+
+def cache_stats() -> dict:
+    return _insight_cache.stats()
+
+def _message_content(response: httpx.Response) -> str | None:
+    """The reply text; None for an error status or an empty or malformed body."""
+    if response.is_error:
+        return None
+    try:
+        choices = response.json().get("choices") or []
+    except ValueError:
+        return None
+    message = choices[0].get("message", {}).get("content") if choices else None
+    return message.strip() if message else None
+
+async def get_llm_response(prompt: str, system_prompt: str = "You are a helpful assistant.", json_mode: bool = False,
+                           priority: int = INTERACTIVE, on_text=None) -> str | None:
+    """Sends a prompt to the OpenRouter API and returns the text response.
+    With json_mode the model is asked to reply with a single JSON object.
+    Calls go through the shared dispatcher: identical pending prompts are sent
+    once, and `priority` (llm_dispatcher.INTERACTIVE/BACKGROUND) orders the queue.
+    `on_text(text)` is awaited with a successful reply even if this call has
+    given up waiting for it (e.g. to cache it)."""
     api_key = os.getenv("OPENROUTER_API_KEY")
     
     if not api_key:
-        print("Error: OPENROUTER_API_KEY environment variable not set or empty.")
+        logger.error("Error: OPENROUTER_API_KEY environment variable not set or empty.")
         return None
 
     headers = {
@@ -29,118 +102,211 @@ async def get_llm_response(prompt: str, system_prompt: str = "You are a helpful
             {"role": "user", "content": prompt}
         ]
     }
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+
+    async def deliver(response: httpx.Response):
+        text = _message_content(response)
+        if text is not None and on_text is not None:
+            await on_text(text)
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{OPENROUTER_API_BASE}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30.0 # Set a reasonable timeout
-            )
-            response.raise_for_status() # Raise HTTPError for bad responses
-            data = response.json()
-            
-            # Extract the message content
-            if data.get("choices") and len(data["choices"]) > 0:
-                message = data["choices"][0].get("message", {}).get("content")
-                if message:
-                    return message.strip()
-                else:
-                    print("Error: No message content found in LLM response.")
-                    return None
-            else:
-                print("Error: No choices found in LLM response.")
-                return None
-                
+        response = await dispatcher.submit(
+            json.dumps(payload, sort_keys=True),
+            lambda: upstream_request("openrouter", "POST", OPENROUTER_CHAT_PATH, headers=headers, json=payload),
+            priority,
+            on_response=deliver
+        )
+        response.raise_for_status() # Raise HTTPError for bad responses
+        message = _message_content(response)
+        if message is None:
+            logger.error("Error: No message content found in LLM response.")
+        return message
+
     except httpx.HTTPStatusError as e:
-        print(f"LLM API request failed with status {e.response.status_code}: {e.response.text}")
+        logger.error(f"LLM API request failed with status {e.response.status_code}: {e.response.text}")
         return None
     except httpx.RequestError as e:
-        print(f"LLM API request failed: {e}")
-        return None
-    except json.JSONDecodeError:
-        print("Error decoding LLM API response.")
+        logger.error(f"LLM API request failed: {e}")
         return None
     except Exception as e:
-        print(f"An unexpected error occurred calling LLM API: {e}")
+        logger.error(f"An unexpected error occurred calling LLM API: {e}")
         return None
 
-async def generate_weather_summary(weather_data: dict) -> str | None:
+def _forecast_today(today: DaySummary | None) -> dict:
+    if today is None:
+        return {"max_temp_c": None, "min_temp_c": None, "condition": None, "chance_of_rain": None}
+    return {
+        "max_temp_c": today.maxtemp_c,
+        "min_temp_c": today.mintemp_c,
+        "condition": today.condition.text,
+        "chance_of_rain": today.daily_chance_of_rain
+    }
+
+async def generate_weather_summary(weather: WeatherReport, priority: int = INTERACTIVE) -> str | None:
     """Generates a natural language summary of the weather data."""
     # Create a concise representation of the weather for the prompt
     try:
-        location = weather_data.get('location', {})
-        current = weather_data.get('current', {})
-        forecast_today = weather_data.get('forecast', {}).get('forecastday', [{}])[0].get('day', {})
-        
+        location = weather.location
+        current = weather.current
+
         prompt_data = {
-            "location": f"{location.get('name')}, {location.get('region')}, {location.get('country')}",
-            "current_temp_c": current.get('temp_c'),
-            "feels_like_c": current.get('feelslike_c'),
-            "condition": current.get('condition', {}).get('text'),
-            "wind_kph": current.get('wind_kph'),
-            "humidity": current.get('humidity'),
-            "forecast_today": {
-                "max_temp_c": forecast_today.get('maxtemp_c'),
-                "min_temp_c": forecast_today.get('mintemp_c'),
-                "condition": forecast_today.get('condition', {}).get('text'),
-                "chance_of_rain": forecast_today.get('daily_chance_of_rain')
-            }
+            "location": f"{location.name}, {location.region}, {location.country}",
+            "current_temp_c": current.temp_c,
+            "feels_like_c": current.feelslike_c,
+            "condition": current.condition.text,
+            "wind_kph": current.wind_kph,
+            "humidity": current.humidity,
+            "forecast_today": _forecast_today(weather.today())
         }
         prompt_context = json.dumps(prompt_data, indent=2)
     except Exception as e:
-        print(f"Error formatting weather data for summary prompt: {e}")
+        logger.error(f"Error formatting weather data for summary prompt: {e}")
         return None
 
     prompt = f"Based on the following weather data, provide a brief, engaging, natural language summary (2-3 sentences max) suitable for a general user. Focus on the key conditions.\n\nWeather Data:\n```json\n{prompt_context}\n```\n\nSummary:"
     
     system_prompt = "You are a weather summarizer. Provide concise and easy-to-understand weather reports."
-    return await get_llm_response(prompt, system_prompt)
+    return await get_cached_llm_response("summary", prompt_data, prompt, system_prompt, priority)
 
-async def generate_activity_suggestions(weather_data: dict) -> str | None:
+async def generate_activity_suggestions(weather: WeatherReport, priority: int = INTERACTIVE) -> str | None:
     """Generates activity suggestions based on the weather."""
     try:
-        location = weather_data.get('location', {})
-        current = weather_data.get('current', {})
-        forecast_today = weather_data.get('forecast', {}).get('forecastday', [{}])[0].get('day', {})
+        forecast_today = _forecast_today(weather.today())
         prompt_data = {
-            "location": location.get('name'),
-            "current_temp_c": current.get('temp_c'),
-            "condition": current.get('condition', {}).get('text'),
-            "forecast_condition": forecast_today.get('condition', {}).get('text'),
-            "chance_of_rain": forecast_today.get('daily_chance_of_rain')
+            "location": weather.location.name,
+            "current_temp_c": weather.current.temp_c,
+            "condition": weather.current.condition.text,
+            "forecast_condition": forecast_today["condition"],
+            "chance_of_rain": forecast_today["chance_of_rain"]
         }
         prompt_context = json.dumps(prompt_data, indent=2)
     except Exception as e:
-        print(f"Error formatting weather data for activity prompt: {e}")
+        logger.error(f"Error formatting weather data for activity prompt: {e}")
         return None
 
     prompt = f"Given the following weather conditions, suggest 2-3 suitable activities (mix of indoor/outdoor if appropriate). Keep suggestions brief and creative.You can also use a bit of sarcasm and humor like if the weather is too hot you can suggest just netflix and chill, or if it's too cold again suggest netflix and chill with\n\nWeather:\n```json\n{prompt_context}\n```\n\nSuggestions (use bullet points):"
     
     system_prompt = "You are an activity suggestion bot based on weather conditions."
-    return await get_llm_response(prompt, system_prompt)
+    return await get_cached_llm_response("activities", prompt_data, prompt, system_prompt, priority)
 
-async def generate_clothing_recommendations(weather_data: dict) -> str | None:
+async def generate_clothing_recommendations(weather: WeatherReport, priority: int = INTERACTIVE) -> str | None:
     """Generates clothing recommendations based on the weather."""
     try:
-        current = weather_data.get('current', {})
-        forecast_today = weather_data.get('forecast', {}).get('forecastday', [{}])[0].get('day', {})
+        current = weather.current
+        forecast_today = _forecast_today(weather.today())
         prompt_data = {
-            "current_temp_c": current.get('temp_c'),
-            "feels_like_c": current.get('feelslike_c'),
-            "condition": current.get('condition', {}).get('text'),
-            "wind_kph": current.get('wind_kph'),
-            "max_temp_c": forecast_today.get('maxtemp_c'),
-            "min_temp_c": forecast_today.get('mintemp_c'),
-            "chance_of_rain": forecast_today.get('daily_chance_of_rain')
+            "current_temp_c": current.temp_c,
+            "feels_like_c": current.feelslike_c,
+            "condition": current.condition.text,
+            "wind_kph": current.wind_kph,
+            "max_temp_c": forecast_today["max_temp_c"],
+            "min_temp_c": forecast_today["min_temp_c"],
+            "chance_of_rain": forecast_today["chance_of_rain"]
         }
         prompt_context = json.dumps(prompt_data, indent=2)
     except Exception as e:
-        print(f"Error formatting weather data for clothing prompt: {e}")
+        logger.error(f"Error formatting weather data for clothing prompt: {e}")
         return None
 
     prompt = f"Based on the following weather data, recommend 2-3 practical and sensible clothing items or layers. Mention if an umbrella or raincoat is needed.\n\nWeather:\n```json\n{prompt_context}\n```\n\nRecommendations (use bullet points):"
     
     system_prompt = "You provide practical clothing advice based on weather conditions."
-    return await get_llm_response(prompt, system_prompt) 
\ No newline at end of file
+    return await get_cached_llm_response("clothing", prompt_data, prompt, system_prompt, priority)
+
+# --- Combined Insights ---
+INSIGHT_FIELDS = ("summary", "activities", "clothing")
+
+def _parse_insights(raw: str) -> dict | None:
+    """Validates the combined JSON reply. Returns None if any field is missing or malformed."""
+    text = raw.strip()
+    if text.startswith("```"):
+        # Tolerate a fenced reply even though we asked for bare JSON
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    insights = {}
+    for field in INSIGHT_FIELDS:
+        value = data.get(field)
+        if isinstance(value, list) and value and all(isinstance(item, str) for item in value):
+            value = "\n".join(f"- {item.strip()}" for item in value)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        insights[field] = value.strip()
+    return insights
+
+async def _generate_insights_separately(weather: WeatherReport, priority: int) -> dict:
+    summary, activities, clothing = await asyncio.gather(
+        generate_weather_summary(weather, priority),
+        generate_activity_suggestions(weather, priority),
+        generate_clothing_recommendations(weather, priority)
+    )
+    return {"summary": summary, "activities": activities, "clothing": clothing}
+
+def _combined_prompt_data(weather: WeatherReport) -> dict:
+    location = weather.location
+    current = weather.current
+    return {
+        "location": f"{location.name}, {location.region}, {location.country}",
+        "current_temp_c": current.temp_c,
+        "feels_like_c": current.feelslike_c,
+        "condition": current.condition.text,
+        "wind_kph": current.wind_kph,
+        "humidity": current.humidity,
+        "forecast_today": _forecast_today(weather.today())
+    }
+
+async def has_cached_insights(weather: WeatherReport) -> bool:
+    """True if generate_weather_insights would be answered from the cache."""
+    try:
+        key = insight_cache_key("combined", _combined_prompt_data(weather))
+    except Exception:
+        return False
+    return await _insight_cache.contains(key)
+
+async def generate_weather_insights(weather: WeatherReport, priority: int = INTERACTIVE) -> dict:
+    """Generates the summary, activity suggestions and clothing advice with one LLM call.
+    Falls back to the three per-field generators if the reply can't be parsed.
+    Prefetching passes llm_dispatcher.BACKGROUND so users' requests go first."""
+    try:
+        prompt_data = _combined_prompt_data(weather)
+        prompt_context = json.dumps(prompt_data, indent=2)
+    except Exception as e:
+        logger.error(f"Error formatting weather data for combined prompt: {e}")
+        return {field: None for field in INSIGHT_FIELDS}
+
+    key = insight_cache_key("combined", prompt_data)
+    cached = await _insight_cache.get(key)
+    if cached is not None:
+        return cached
+
+    prompt = (
+        "Based on the following weather data, reply with a JSON object with exactly these keys:\n"
+        '- "summary": a brief, engaging, natural language summary (2-3 sentences max) focused on the key conditions.\n'
+        '- "activities": 2-3 suitable activities (mix of indoor/outdoor if appropriate) as a list of short strings. Be creative, a bit of sarcasm and humor is welcome (e.g. netflix and chill when it\'s too hot or too cold).\n'
+        '- "clothing": 2-3 practical clothing items or layers as a list of short strings. Mention if an umbrella or raincoat is needed.\n'
+        f"\nWeather Data:\n```json\n{prompt_context}\n```"
+    )
+    system_prompt = "You are a weather assistant. You always answer with a single valid JSON object and nothing else."
+
+    async def store(raw: str):
+        insights = _parse_insights(raw)
+        if insights is not None:
+            await _insight_cache.set(key, insights)
+
+    with stage_timer("llm_combined"):
+        raw = await get_llm_response(prompt, system_prompt, json_mode=True, priority=priority, on_text=store)
+    if raw is None:
+        # The request itself failed; three more calls would most likely fail too
+        return {field: None for field in INSIGHT_FIELDS}
+
+    insights = _parse_insights(raw)
+    if insights is None:
+        logger.warning("Combined insight reply was not valid JSON. Falling back to per-field generators.")
+        return await _generate_insights_separately(weather, priority)
+    return insights
@@ -1,39 +1,86 @@
 # --- Load Environment Variables FIRST ---
 import asyncio
-import json
+import base64
 import os
+import logging
+import math
+import time
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
-import urllib.parse # For URL encoding search query
+load_dotenv() # Before local imports, which read their settings at import time
+from pydantic import BaseModel, Field, model_validator
 import httpx
-from datetime import datetime, date as date_obj
+from datetime import datetime, timezone, date as date_obj
 from io import StringIO
 import csv
+import zlib
 
 # --- FastAPI Imports ---
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Query, Depends
-from fastapi.responses import JSONResponse, Response, StreamingResponse, RedirectResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
 
 # --- Prisma Imports ---
 from prisma import Prisma
 from prisma.models import WeatherSearch
+from prisma.partials import WeatherSearchSummary
 from prisma.errors import RecordNotFoundError
 
+# --- Logging & Metrics ---
+from logging_setup import setup_logging, shutdown_logging
+import metrics
+from http_caching import HTTPCachingMiddleware, HISTORY_MAX_AGE, cache_control
+from serialization import dumps, dumps_indented, loads, extend_object, embed_raw, stored_json, raw_json_response
+from weather_model import WeatherReport, transform_weather
+from metrics import timed
+from cache import all_cache_stats, close_shared_caches
+from resilience import guard_stats
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# --- Shared HTTP Clients ---
+import http_client
+
+# --- Offline Reverse Geocoding (memory-mapped gazetteer) ---
+import gazetteer
+
+# --- Geocoding (cached) ---
+from geocoding import geocode_address, reverse_geocode, format_address, normalize_location
+
+# --- Forecasts (cached per grid cell) ---
+from forecast import fetch_forecast, forecast_ttl_remaining
+
+# --- Past-Date Weather Store ---
+from weather_history import is_past_date, fetch_history, backfill_history, HISTORY_BACKFILL_MAX_DAYS
+
+# --- YouTube Videos (cached, quota-aware) ---
+from youtube import cache_stats as youtube_cache_stats, fetch_youtube_videos
+
+# --- Search History Write-Behind ---
+from search_writer import search_writer
+
+# --- Prefetch Scheduler ---
+from prefetch import PrefetchScheduler
+
+# --- Location Autocomplete ---
+from suggest import LocationSuggester, SUGGEST_MAX_RESULTS, SUGGEST_REFRESH_INTERVAL
+
 # --- AI Service Import ---
-from ai_service import (
-    generate_weather_summary,
-    generate_activity_suggestions,
-    generate_clothing_recommendations
-)
+from ai_service import generate_weather_insights
+from llm_dispatcher import dispatcher as llm_dispatcher
+
+# --- Admission Control (rate limits, upstream limits, overload mode) ---
+import admission
 
 # --- Load Environment Variables ---
-load_dotenv()
-WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY') # Load Maps key here
-YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY') # Load YouTube Key
+# Overall time budget for AI insights + YouTube; anything slower comes back as null
+ENRICHMENT_DEADLINE_SECONDS = float(os.getenv('ENRICHMENT_DEADLINE_SECONDS', '10'))
+# Batch endpoint limits
+BATCH_MAX_LOCATIONS = int(os.getenv('BATCH_MAX_LOCATIONS', '100'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
 
 # --- Prisma Client Initialization ---
 db = Prisma(auto_register=True)
@@ -42,18 +89,36 @@ db = Prisma(auto_register=True)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Connect the database
-    print("Connecting Prisma client...")
+    logger.info("Connecting Prisma client...")
     await db.connect()
-    print("Prisma client connected.")
+    logger.info("Prisma client connected.")
+    await http_client.startup()
+    await llm_dispatcher.start()
+    gazetteer.load()
+    await search_writer.start()
+    await prefetcher.start()
+    await location_suggester.start()
     yield
+    # Shutdown: Stop background work, then flush queued searches while the DB is still connected
+    await location_suggester.stop()
+    await prefetcher.stop()
+    await search_writer.stop()
+    await llm_dispatcher.stop()
+    # Close pooled HTTP connections
+    await http_client.shutdown()
+    gazetteer.close()
+    close_shared_caches()
     # Shutdown: Disconnect the database
     if db.is_connected():
-        print("Disconnecting Prisma client...")
+        logger.info("Disconnecting Prisma client...")
         await db.disconnect()
-        print("Prisma client disconnected.")
+        logger.info("Prisma client disconnected.")
+    # Flush any log records still queued
+    shutdown_logging()
 
 # --- FastAPI App Initialization ---
-app = FastAPI(lifespan=lifespan)
+# orjson for any route still returning plain dicts; hot routes return pre-encoded bytes
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # --- CORS Middleware Setup ---
 # Allow requests from common React dev ports (Vite, Create React App)
@@ -73,10 +138,86 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# --- API Keys and Base URLs ---
-BASE_URL = "http://api.weatherapi.com/v1"
+# ETag/304 and gzip/brotli for non-streamed responses
+app.add_middleware(HTTPCachingMiddleware)
+# Feeds overload mode; counts streamed responses until they finish
+app.add_middleware(admission.LoadTrackingMiddleware)
+
+# --- Request Metrics Middleware ---
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get('route')
+        metrics.HTTP_DURATION.observe(
+            time.perf_counter() - started,
+            request.method,
+            route.path if route is not None else "unmatched",
+            status
+        )
+
+def collect_component_metrics() -> dict:
+    """Scrape-time samples for caches, circuit breakers and the search writer."""
+    caches = all_cache_stats()
+    guards = guard_stats()
+    limiters = http_client.limiter_stats()
+    llm = llm_dispatcher.stats()
+    offline = gazetteer.stats() or {'hits': 0, 'misses': 0}
+    return {
+        'cache_hits_total': ('counter', "Cache lookups that hit.",
+                             [({'cache': c['name']}, c['hits']) for c in caches]),
+        'cache_misses_total': ('counter', "Cache lookups that missed.",
+                               [({'cache': c['name']}, c['misses']) for c in caches]),
+        'cache_hit_ratio': ('gauge', "Hits / lookups since start.",
+                            [({'cache': c['name']}, c['hit_ratio']) for c in caches]),
+        'cache_entries': ('gauge', "Entries currently held.",
+                          [({'cache': c['name']}, c['size']) for c in caches]),
+        'circuit_open': ('gauge', "1 if the upstream's circuit is not closed.",
+                         [({'upstream': name}, int(g['state'] != 'closed')) for name, g in guards.items()]),
+        'circuit_rejected_total': ('counter', "Calls failed fast by an open circuit.",
+                                   [({'upstream': name}, g['rejected']) for name, g in guards.items()]),
+        'upstream_hedged_total': ('counter', "Hedged second attempts started.",
+                                  [({'upstream': name}, g['hedged']) for name, g in guards.items()]),
+        'upstream_concurrency_waiting': ('gauge', "Calls queued for an upstream concurrency slot.",
+                                         [({'upstream': name}, l['waiting']) for name, l in limiters.items()]),
+        'admission_shed_total': ('counter', "Work refused by admission control, by reason.",
+                                 [({'reason': reason, 'target': target}, count)
+                                  for (reason, target), count in admission.load.shed.items()]),
+        'overload_mode': ('gauge', "1 while AI and YouTube enrichments are being dropped.",
+                          [({}, int(admission.load.overloaded()))]),
+        'llm_dispatch_total': ('counter', "LLM prompts by dispatch outcome.",
+                               [({'outcome': outcome}, llm[outcome])
+                                for outcome in ('sent', 'deduplicated', 'rate_limited', 'rejected', 'abandoned')]),
+        'llm_pending': ('gauge', "LLM prompts waiting for a dispatcher slot.",
+                        [({'priority': priority}, count) for priority, count in llm['pending'].items()]),
+        'llm_in_flight': ('gauge', "LLM calls currently being sent.", [({}, llm['in_flight'])]),
+        'llm_rate_limit_pause_seconds': ('gauge', "Time left before LLM calls resume after a 429.",
+                                         [({}, llm['paused_for'])]),
+        'search_writes_total': ('counter', "Search history rows by write outcome.",
+                                [({'outcome': 'written'}, search_writer.written),
+                                 ({'outcome': 'dropped'}, search_writer.dropped),
+                                 ({'outcome': 'failed'}, search_writer.failed)]),
+        'search_write_queue_depth': ('gauge', "Searches waiting to be written.",
+                                     [({}, search_writer.qsize())]),
+        'gazetteer_lookups_total': ('counter', "Offline reverse geocoding lookups by result.",
+                                    [({'result': 'hit'}, offline['hits']),
+                                     ({'result': 'miss'}, offline['misses'])]),
+        'youtube_quota_remaining': ('gauge', "YouTube Data API units left today.",
+                                    [({}, youtube_cache_stats()['quota_remaining'])]),
+    }
+
+metrics.register_collector(collect_component_metrics)
 
 # --- Helper Functions (Async) ---
 async def get_recent_searches_async():
@@ -90,52 +231,257 @@ async def get_recent_searches_async():
         )
         return searches
     except Exception as e:
-        print(f"Error fetching recent searches: {e}")
+        logger.error(f"Error fetching recent searches: {e}")
         return []
 
-# --- NEW: YouTube API Fetch Function ---
-async def fetch_youtube_videos(location_name: str, max_results: int = 3):
-    if not YOUTUBE_API_KEY:
-        print("YouTube API Key not configured. Skipping video search.")
-        return []
-    if not location_name:
-        print("No location name provided for YouTube search. Skipping.")
-        return []
+# --- Search History Helpers ---
+SEARCH_FIELDS = ('id', 'city', 'state', 'country', 'timestamp', 'weatherData',
+                 'lat', 'lon', 'tempC', 'feelslikeC', 'condition', 'locationName')
+SEARCH_ORDER = [{'timestamp': 'desc'}, {'id': 'desc'}]
+SEARCH_PAGE_DEFAULT = 50
+SEARCH_PAGE_MAX = 200
+
+def encode_cursor(search) -> str:
+    raw = f"{search.timestamp.isoformat()}|{search.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
     try:
-        # Construct search query (you can customize this)
-        search_query = urllib.parse.quote(f"travel guide {location_name}")
-        youtube_api_url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&q={search_query}&key={YOUTUBE_API_KEY}&maxResults={max_results}&type=video&order=relevance"
-
-        print(f"Requesting YouTube Videos: {youtube_api_url[:150]}...") # Log truncated URL
-        async with httpx.AsyncClient() as client:
-            response = await client.get(youtube_api_url, timeout=10.0)
-            response.raise_for_status() # Raise HTTP errors
-            data = response.json()
-
-        videos = []
-        if 'items' in data:
-            for item in data['items']:
-                if item.get('id', {}).get('videoId'): # Check if it's a video result
-                    snippet = item.get('snippet', {})
-                    videos.append({
-                        'videoId': item['id']['videoId'],
-                        'title': snippet.get('title'),
-                        'thumbnailUrl': snippet.get('thumbnails', {}).get('default', {}).get('url')
-                    })
-        print(f"Found {len(videos)} YouTube videos for '{location_name}'")
-        return videos
+        timestamp, search_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(timestamp), search_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    except httpx.RequestError as e:
-        print(f"Error fetching YouTube API: {e}")
-        return [] # Return empty list on network/request error
-    except httpx.HTTPStatusError as e:
-        print(f"YouTube API returned error: {e.response.status_code} - {e.response.text}")
-        # Handle specific errors like quota limits (403) if needed
-        return []
-    except Exception as e:
-        print(f"Error processing YouTube response: {e}")
-        return [] # Return empty list on other errors
+def cursor_filter(position: tuple[datetime, str]) -> dict:
+    """Rows strictly after the cursor in (timestamp desc, id desc) order."""
+    timestamp, search_id = position
+    return {
+        'OR': [
+            {'timestamp': {'lt': timestamp}},
+            {'timestamp': timestamp, 'id': {'lt': search_id}},
+        ]
+    }
+
+def build_search_filter(city: str | None, country: str | None,
+                        start: datetime | None, end: datetime | None) -> dict:
+    where = {}
+    # Matched on the stored lower-cased keys so the indexes can be used
+    if city:
+        where['cityKey'] = search_key(city)
+    if country:
+        where['countryKey'] = search_key(country)
+    if start or end:
+        where['timestamp'] = {}
+        if start:
+            where['timestamp']['gte'] = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        if end:
+            where['timestamp']['lte'] = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    return where
+
+def parse_search_fields(fields: str | None) -> set[str]:
+    """Parses the `fields=` projection. `id` is always included."""
+    if not fields:
+        return set(SEARCH_FIELDS)
+    selected = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = selected - set(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected | {'id'}
+
+def serialize_search(search, selected: set[str]) -> dict:
+    item = {field: getattr(search, field) for field in SEARCH_FIELDS if field in selected}
+    if 'timestamp' in item:
+        item['timestamp'] = item['timestamp'].isoformat()
+    if 'weatherData' in item and not isinstance(item['weatherData'], dict):
+        # Rows written by save_search come back as JSON strings
+        try:
+            item['weatherData'] = loads(item['weatherData'])
+        except (ValueError, TypeError):
+            item['weatherData'] = None
+    return item
+
+def encode_search(search, selected: set[str]) -> bytes:
+    """JSON for one search row. The stored weatherData string is embedded as-is
+    instead of being parsed and re-encoded (see serialize_search for dict output)."""
+    fields = {field: getattr(search, field) for field in SEARCH_FIELDS if field in selected and field != 'weatherData'}
+    if 'weatherData' not in selected:
+        return dumps(fields)
+    return embed_raw(fields, {'weatherData': stored_json(search.weatherData)})
+
+# --- Export Helpers ---
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+EXPORT_CSV_HEADERS = ['id', 'timestamp', 'city', 'state', 'country',
+                      'weather_location', 'weather_condition', 'weather_temp_c', 'weather_feelslike_c']
+EXPORT_MEDIA_TYPES = {'json': "application/json", 'ndjson': "application/x-ndjson", 'csv': "text/csv"}
+
+async def fetch_export_batch(model, where: dict, after) -> list:
+    if after is not None:
+        where = {'AND': [where, cursor_filter((after.timestamp, after.id))]}
+    return await model.prisma().find_many(where=where, order=SEARCH_ORDER, take=EXPORT_BATCH_SIZE)
+
+async def iter_export_batches(model, where: dict, first_batch: list):
+    """Yields batches until the table is exhausted, paging by (timestamp, id)."""
+    batch = first_batch
+    while batch:
+        yield batch
+        if len(batch) < EXPORT_BATCH_SIZE:
+            return
+        batch = await fetch_export_batch(model, where, batch[-1])
+
+def export_record(search) -> dict:
+    """Search row as exported to JSON/NDJSON, without sensitive or UI-only data."""
+    item = serialize_search(search, set(SEARCH_FIELDS))
+    weather_data = item.get('weatherData')
+    if weather_data:
+        # Keep only essential weather information (drops API keys and the like)
+        item['weatherData'] = {
+            'location': weather_data.get('location'),
+            'current': weather_data.get('current'),
+            'forecast': weather_data.get('forecast'),
+            'ai_summary': weather_data.get('ai_summary'),
+            'ai_activities': weather_data.get('ai_activities'),
+            'ai_clothing': weather_data.get('ai_clothing'),
+            'youtube_videos': weather_data.get('youtube_videos')
+        }
+    return item
+
+def export_csv_row(search) -> list:
+    # Reads the promoted columns only; CSV export never loads weatherData
+    return [
+        search.id,
+        search.timestamp.isoformat() if search.timestamp else '',
+        search.city,
+        search.state,
+        search.country,
+        search.locationName,
+        search.condition,
+        search.tempC,
+        search.feelslikeC
+    ]
+
+async def write_json_array(batches):
+    yield "["
+    first = True
+    async for batch in batches:
+        parts = [dumps_indented(export_record(search)).decode() for search in batch]
+        yield ("\n" if first else ",\n") + ",\n".join(parts)
+        first = False
+    yield "\n]\n"
+
+async def write_ndjson(batches):
+    async for batch in batches:
+        yield b"".join(dumps(export_record(search)) + b"\n" for search in batch).decode()
+
+async def write_csv(batches):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_HEADERS)
+    async for batch in batches:
+        writer.writerows(export_csv_row(search) for search in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+EXPORT_WRITERS = {'json': write_json_array, 'ndjson': write_ndjson, 'csv': write_csv}
+# CSV only needs the promoted columns, so it skips the weatherData blob
+EXPORT_MODELS = {'json': WeatherSearch, 'ndjson': WeatherSearch, 'csv': WeatherSearchSummary}
+
+async def gzip_chunks(chunks):
+    """Compresses a text stream on the fly into a single gzip member."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) # | 16 selects the gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+# --- Admission Control ---
+def enforce_client_rate(request: Request, cost: float = 1.0):
+    """Raises 429 with Retry-After once the caller's token bucket is empty."""
+    client = admission.client_id(request.headers, request.client.host if request.client else None)
+    retry_after = admission.clients.acquire(client, cost)
+    if retry_after > 0:
+        admission.load.record_shed("client_rate_limit", request.url.path)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, slow down",
+            headers={'Retry-After': str(math.ceil(retry_after))}
+        )
+
+async def rate_limited(request: Request):
+    enforce_client_rate(request)
+
+# --- Enrichment Fan-out ---
+def start_enrichment_tasks(report: WeatherReport, location_name: str,
+                           include_ai: bool = True, include_youtube: bool = True) -> tuple[dict, list]:
+    """Starts the requested enrichments. Returns the tasks by name, plus the names
+    of those shed because the service is in overload mode."""
+    shed = []
+    if admission.load.overloaded():
+        # Shed the optional work first; the core weather payload is still served
+        for name, label, included in (('ai', 'ai', include_ai), ('youtube_videos', 'youtube', include_youtube)):
+            if included:
+                admission.load.record_shed("overload", label)
+                shed.append(name)
+        include_ai = include_youtube = False
+    tasks = {}
+    if include_ai:
+        tasks['ai'] = asyncio.create_task(timed("ai_insights", generate_weather_insights(report)))
+    if include_youtube:
+        tasks['youtube_videos'] = asyncio.create_task(timed("youtube", fetch_youtube_videos(location_name)))
+    return tasks, shed
+
+def task_result(name: str, task: asyncio.Task):
+    """Result of a finished enrichment task, or None if it raised."""
+    if task.exception() is not None:
+        logger.error(f"Error in enrichment '{name}': {task.exception()}")
+        return None
+    return task.result()
+
+def enrichment_fields(name: str, result) -> dict:
+    """Maps an enrichment task's result onto the response fields it fills."""
+    if name == 'ai':
+        insights = result or {}
+        return {
+            'ai_summary': insights.get('summary'),
+            'ai_activities': insights.get('activities'),
+            'ai_clothing': insights.get('clothing'),
+        }
+    return {name: result}
+
+def shed_fields(shed: list) -> dict:
+    """Fields for enrichments skipped in overload mode: the usual keys as None, so
+    clients see the same shape, and a flag telling them why they're empty."""
+    fields = {}
+    for name in shed:
+        fields.update(enrichment_fields(name, None))
+    if shed:
+        fields['enrichments_shed'] = True
+    return fields
+
+async def gather_enrichments(report: WeatherReport, location_name: str,
+                             include_ai: bool = True, include_youtube: bool = True) -> dict:
+    """Runs the AI insights and YouTube lookup concurrently under one deadline.
+    Branches that fail, miss the deadline or are shed are returned as None."""
+    tasks, shed = start_enrichment_tasks(report, location_name, include_ai, include_youtube)
+    if not tasks:
+        return shed_fields(shed)
+    try:
+        done, pending = await asyncio.wait(tasks.values(), timeout=ENRICHMENT_DEADLINE_SECONDS)
+    finally:
+        # Also covers the client disconnecting while we wait
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+
+    results = shed_fields(shed)
+    for name, task in tasks.items():
+        if task in pending:
+            logger.warning(f"Enrichment '{name}' missed the {ENRICHMENT_DEADLINE_SECONDS}s deadline.")
+            results.update(enrichment_fields(name, None))
+        else:
+            results.update(enrichment_fields(name, task_result(name, task)))
+    return results
 
 # --- Pydantic Models for Request Bodies ---
 class SearchUpdate(BaseModel):
@@ -143,10 +489,226 @@ class SearchUpdate(BaseModel):
     state: str | None = Field(None, min_length=1)
     country: str | None = Field(None, min_length=1)
 
+# --- Core Weather Loading ---
+# Shared by the JSON and streaming routes. Both raise HTTPException for bad input
+# and let httpx errors propagate so each route can map them to a 503.
+async def load_weather_by_location(city: str, state: str | None, country: str, date: str | None = None) -> tuple[WeatherReport, str]:
+    """Geocodes the location and fetches its forecast.
+    Returns the weather report and the locality name used for enrichments."""
+    # First, get coordinates (cached, falls back to Google Geocoding API)
+    location_query = format_address(city, state, country)
+    location = await timed("geocode", geocode_address(city, state, country))
+    if location is None:
+        raise HTTPException(status_code=400, detail=f"Location not found: {location_query}")
+
+    latitude = location['lat']
+    longitude = location['lng']
+    location_components = location['components']
+
+    # Now get weather data from WeatherAPI.com (cached per grid cell).
+    # Past dates are immutable and come from the permanent history store.
+    if is_past_date(date):
+        weather_data = await timed("history", fetch_history(latitude, longitude, date, days=5))
+    else:
+        weather_data = await timed("forecast", fetch_forecast(latitude, longitude, days=5, dt=date))
+
+    report = transform_weather(
+        weather_data,
+        name=location_components.get('locality', city),
+        region=location_components.get('administrative_area_level_1', state),
+        country=location_components.get('country', country),
+        lat=latitude,
+        lon=longitude
+    )
+
+    return report, location_components.get('locality', city)
+
+async def load_weather_by_coordinates(lat: float, lon: float) -> tuple[WeatherReport, str]:
+    """Fetches the forecast for a point and labels it via reverse geocoding.
+    Returns the weather report and the locality name used for enrichments."""
+    # Get weather data from WeatherAPI.com (cached per grid cell) and the location
+    # name via reverse geocoding (cached by rounded lat/lon) at the same time
+    weather_data, location_components = await asyncio.gather(
+        timed("forecast", fetch_forecast(lat, lon, days=5)),
+        timed("reverse_geocode", reverse_geocode(lat, lon))
+    )
+
+    report = transform_weather(
+        weather_data,
+        name=location_components.get('locality', 'Unknown'),
+        region=location_components.get('administrative_area_level_1', 'Unknown'),
+        country=location_components.get('country', 'Unknown'),
+        lat=lat,
+        lon=lon
+    )
+
+    return report, location_components.get('locality', 'Unknown')
+
+# --- Background Prefetch (keeps popular locations warm; started in lifespan) ---
+prefetcher = PrefetchScheduler(db, load_weather_by_location)
+
+# --- Location Suggestions (searched locations refreshed in the background; started in lifespan) ---
+location_suggester = LocationSuggester(db)
+
+def search_key(value: str) -> str:
+    """Case-insensitive filter key stored in cityKey/countryKey."""
+    return value.lower()
+
+def location_keys(city: str, country: str) -> dict:
+    return {'cityKey': search_key(city), 'countryKey': search_key(country)}
+
+def promoted_columns(report: WeatherReport) -> dict:
+    """Hot weatherData fields stored as their own indexed-friendly columns."""
+    return {
+        'lat': report.location.lat,
+        'lon': report.location.lon,
+        'tempC': report.current.temp_c,
+        'feelslikeC': report.current.feelslike_c,
+        'condition': report.current.condition.text,
+        'locationName': report.location.name,
+    }
+
+async def save_search(city: str, state: str, country: str, report: WeatherReport, report_json: bytes):
+    """Queues the search for a batched write; the request never waits on the DB.
+    report_json is the encoding also sent in the response body."""
+    await search_writer.enqueue({
+        'city': city,
+        'state': state,
+        'country': country,
+        'weatherData': report_json.decode(),
+        **promoted_columns(report),
+        **location_keys(city, country)
+    })
+
+def core_fields(report: WeatherReport) -> dict:
+    """Fields every weather route adds next to the report."""
+    return {
+        'latitude': report.location.lat,
+        'longitude': report.location.lon,
+        'map_api_key': GOOGLE_MAPS_API_KEY  # Add API key for map component only
+    }
+
+async def weather_cache_headers(report: WeatherReport, enrichments: dict, date: str | None = None) -> dict:
+    """Lets clients and the CDN reuse a weather response for as long as the
+    forecast behind it stays cached here. Responses missing an enrichment
+    (failed, late or shed) are not reused, so recovery shows up right away."""
+    if enrichments.get('enrichments_shed') or any(value is None for value in enrichments.values()):
+        return {'Cache-Control': 'private, no-cache'}
+    if is_past_date(date):
+        return {'Cache-Control': cache_control(HISTORY_MAX_AGE)}
+    lat, lon = report.location.lat, report.location.lon
+    return {'Cache-Control': cache_control(await forecast_ttl_remaining(lat, lon, 5, date))}
+
+def encode_weather(report: WeatherReport, report_json: bytes, enrichments: dict) -> bytes:
+    """Weather payload as sent by every weather route: the already-encoded report
+    extended with the core fields and enrichments, without re-encoding the report."""
+    return extend_object(report_json, {**core_fields(report), **enrichments})
+
+# --- Server-Sent Events ---
+def format_sse(event: str, data) -> str:
+    # bytes are taken as already-encoded JSON
+    encoded = data if isinstance(data, bytes) else dumps(data)
+    return f"event: {event}\ndata: {encoded.decode()}\n\n"
+
+async def stream_weather_events(report: WeatherReport, report_json: bytes, location_name: str):
+    """Sends the core weather payload first, then each enrichment as it completes."""
+    yield format_sse('weather', encode_weather(report, report_json, {}))
+
+    tasks, shed = start_enrichment_tasks(report, location_name)
+    for key, value in shed_fields(shed).items():
+        yield format_sse(key, value)
+    names = {task: name for name, task in tasks.items()}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + ENRICHMENT_DEADLINE_SECONDS
+    pending = set(tasks.values())
+    try:
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for key, value in enrichment_fields(names[task], task_result(names[task], task)).items():
+                    yield format_sse(key, value)
+        for task in pending:
+            logger.warning(f"Enrichment '{names[task]}' missed the {ENRICHMENT_DEADLINE_SECONDS}s deadline.")
+            for key, value in enrichment_fields(names[task], None).items():
+                yield format_sse(key, value)
+        yield format_sse('done', {})
+    finally:
+        # Also covers the client disconnecting mid-stream
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+class BatchLocation(BaseModel):
+    """Either a city/state/country triple or a lat/lon pair."""
+    city: str | None = Field(None, min_length=1)
+    state: str | None = None
+    country: str | None = Field(None, min_length=1)
+    lat: float | None = Field(None, ge=-90, le=90)
+    lon: float | None = Field(None, ge=-180, le=180)
+
+    @model_validator(mode='after')
+    def check_location(self):
+        has_name = self.city is not None and self.country is not None
+        has_coordinates = self.lat is not None and self.lon is not None
+        if has_name == has_coordinates:
+            raise ValueError("Provide either city and country (state optional) or lat and lon")
+        return self
+
+    def dedup_key(self) -> str:
+        # Exact coordinates: rounding would label nearby points with another
+        # item's lat/lon. Nearby points still share the forecast cell cache.
+        if self.lat is not None:
+            return f"pt:{self.lat!r},{self.lon!r}"
+        return f"fwd:{normalize_location(self.city, self.state, self.country)}"
+
+class BatchWeatherRequest(BaseModel):
+    locations: list[BatchLocation] = Field(..., min_length=1, max_length=BATCH_MAX_LOCATIONS)
+    include_ai: bool = False
+    include_youtube: bool = False
+
+class HistoryBackfillRequest(BaseModel):
+    location: BatchLocation
+    start_date: date_obj
+    end_date: date_obj
+
+    @model_validator(mode='after')
+    def check_range(self):
+        if self.end_date < self.start_date:
+            raise ValueError("end_date must not be before start_date")
+        if (self.end_date - self.start_date).days >= HISTORY_BACKFILL_MAX_DAYS:
+            raise ValueError(f"At most {HISTORY_BACKFILL_MAX_DAYS} days can be backfilled at once")
+        return self
+
 # --- FastAPI Routes ---
 
+# --- Metrics Route (Prometheus) ---
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# --- Location Suggestions API Route ---
+@app.get("/api/locations/suggest")
+async def suggest_locations(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=SUGGEST_MAX_RESULTS)
+):
+    """Typeahead for the search form, served from memory. Pick a suggestion to
+    send an exact city/state/country (or lat/lon) instead of free text."""
+    suggestions = location_suggester.suggest(q, limit)
+    return raw_json_response(dumps(suggestions), headers={'Cache-Control': cache_control(SUGGEST_REFRESH_INTERVAL)})
+
 # --- Get Weather API Route ---
-@app.get("/api/weather")
+@app.get("/api/weather", dependencies=[Depends(rate_limited)])
 async def get_weather(
     city: str = Query(...),
     state: str = Query(...),
@@ -154,336 +716,287 @@ async def get_weather(
     date: str | None = Query(None)
 ):
     try:
-        # First, get coordinates using Google Geocoding API
-        location_query = f"{city}, {state}, {country}"
-        geocoding_url = f"https://maps.googleapis.com/maps/api/geocode/json"
-        
-        async with httpx.AsyncClient() as client:
-            # Use API key for geocoding request
-            geocoding_response = await client.get(
-                geocoding_url,
-                params={
-                    "address": location_query,
-                    "key": GOOGLE_MAPS_API_KEY
-                },
-                timeout=15.0
-            )
-            geocoding_response.raise_for_status()
-            geocoding_data = geocoding_response.json()
-            
-            if geocoding_data.get('status') != 'OK':
-                raise HTTPException(status_code=400, detail=f"Location not found: {location_query}")
-            
-            location = geocoding_data['results'][0]
-            latitude = location['geometry']['location']['lat']
-            longitude = location['geometry']['location']['lng']
-            formatted_address = location['formatted_address']
-            
-            # Extract location components
-            location_components = {}
-            for component in location['address_components']:
-                for type in component['types']:
-                    location_components[type] = component['long_name']
-            
-            # Now get weather data from WeatherAPI.com
-            weather_url = f"{BASE_URL}/forecast.json"
-            params = {
-                "key": WEATHER_API_KEY,
-                "q": f"{latitude},{longitude}",
-                "days": 5
-            }
-            if date:
-                params["dt"] = date
-                
-            weather_response = await client.get(
-                weather_url,
-                params=params,
-                timeout=15.0
-            )
-            weather_response.raise_for_status()
-            weather_data = weather_response.json()
-            
-            # Transform response data
-            transformed_data = {
-                'location': {
-                    'name': location_components.get('locality', city),
-                    'region': location_components.get('administrative_area_level_1', state),
-                    'country': location_components.get('country', country),
-                    'lat': latitude,
-                    'lon': longitude,
-                    'localtime': weather_data['location']['localtime']
-                },
-                'current': {
-                    'temp_c': weather_data['current']['temp_c'],
-                    'condition': {
-                        'text': weather_data['current']['condition']['text'],
-                        'icon': weather_data['current']['condition']['icon']
-                    },
-                    'wind_kph': weather_data['current']['wind_kph'],
-                    'humidity': weather_data['current']['humidity'],
-                    'feelslike_c': weather_data['current']['feelslike_c']
-                },
-                'forecast': {
-                    'forecastday': [
-                        {
-                            'date': day['date'],
-                            'day': {
-                                'maxtemp_c': day['day']['maxtemp_c'],
-                                'mintemp_c': day['day']['mintemp_c'],
-                                'condition': {
-                                    'text': day['day']['condition']['text'],
-                                    'icon': day['day']['condition']['icon']
-                                }
-                            }
-                        }
-                        for day in weather_data['forecast']['forecastday']
-                    ]
-                }
-            }
-            
-            # Generate AI insights
-            try:
-                ai_summary = await generate_weather_summary(transformed_data)
-                ai_activities = await generate_activity_suggestions(transformed_data)
-                ai_clothing = await generate_clothing_recommendations(transformed_data)
-            except Exception as e:
-                print(f"Error generating AI insights: {e}")
-                ai_summary = None
-                ai_activities = None
-                ai_clothing = None
+        report, location_name = await load_weather_by_location(city, state, country, date)
+        # Encoded once; reused for the search history row and the response body
+        report_json = dumps(report)
 
-            # Fetch YouTube videos
-            try:
-                youtube_videos = await fetch_youtube_videos(location_components.get('locality', city))
-            except Exception as e:
-                print(f"Error fetching YouTube videos: {e}")
-                youtube_videos = []
-            
-            # Save search to database if it's not a historical request
-            if not date:
-                try:
-                    await db.weathersearch.create(
-                        data={
-                    'city': city,
-                    'state': state,
-                    'country': country,
-                            'weatherData': json.dumps(transformed_data)
-                        }
-                    )
-                except Exception as e:
-                    print(f"Failed to save search to database: {e}")
-            
-            # Add additional data to response
-            response_data = {
-                **transformed_data,
-                'latitude': latitude,
-                'longitude': longitude,
-                'ai_summary': ai_summary,
-                'ai_activities': ai_activities,
-                'ai_clothing': ai_clothing,
-                'youtube_videos': youtube_videos,
-                'map_api_key': GOOGLE_MAPS_API_KEY  # Add API key for map component only
-            }
-            
-            return response_data
+        # Generate AI insights and fetch YouTube videos concurrently
+        enrichments = await gather_enrichments(report, location_name)
+
+        # Save search to database if it's not a historical request
+        if not date:
+            await save_search(city, state, country, report, report_json)
+
+        # Add additional data to response
+        return raw_json_response(
+            encode_weather(report, report_json, enrichments),
+            headers=await weather_cache_headers(report, enrichments, date)
+        )
+
+    except httpx.RequestError as e:
+        logger.error(f"Error fetching weather API: {e}")
+        raise HTTPException(status_code=503, detail="Weather service unavailable")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_weather: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
+# --- Stream Weather API Route (SSE) ---
+@app.get("/api/weather/stream", dependencies=[Depends(rate_limited)])
+async def stream_weather(
+    city: str = Query(...),
+    state: str = Query(...),
+    country: str = Query(...),
+    date: str | None = Query(None)
+):
+    # Load the core data before opening the stream so errors keep their status codes
+    try:
+        report, location_name = await load_weather_by_location(city, state, country, date)
+        report_json = dumps(report)
+        if not date:
+            await save_search(city, state, country, report, report_json)
     except httpx.RequestError as e:
-        print(f"Error fetching weather API: {e}")
+        logger.error(f"Error fetching weather API: {e}")
         raise HTTPException(status_code=503, detail="Weather service unavailable")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_weather: {e}")
+        logger.error(f"Error in stream_weather: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    return sse_response(stream_weather_events(report, report_json, location_name))
+
 # --- Get Weather by Coordinates API Route ---
-@app.get("/api/weather/coordinates")
+@app.get("/api/weather/coordinates", dependencies=[Depends(rate_limited)])
 async def get_weather_by_coordinates(
     lat: float = Query(...),
     lon: float = Query(...)
 ):
     try:
-        async with httpx.AsyncClient() as client:
-            # Get weather data from WeatherAPI.com
-            weather_url = f"{BASE_URL}/forecast.json"
-            params = {
-                "key": WEATHER_API_KEY,
-                "q": f"{lat},{lon}",
-                "days": 5
-            }
-            
-            weather_response = await client.get(
-                weather_url,
-                params=params,
-                timeout=15.0
-            )
-            weather_response.raise_for_status()
-            weather_data = weather_response.json()
-            
-            # Get location name using reverse geocoding
-            geocoding_url = f"https://maps.googleapis.com/maps/api/geocode/json"
-            geocoding_response = await client.get(
-                geocoding_url,
-                params={
-                    "latlng": f"{lat},{lon}",
-                    "key": GOOGLE_MAPS_API_KEY
-                },
-                timeout=15.0
-            )
-            geocoding_response.raise_for_status()
-            geocoding_data = geocoding_response.json()
-            
-            # Extract location components
-            location_components = {}
-            if geocoding_data.get('status') == 'OK' and geocoding_data['results']:
-                location = geocoding_data['results'][0]
-                for component in location['address_components']:
-                    for type in component['types']:
-                        location_components[type] = component['long_name']
-            
-            transformed_data = {
-                'location': {
-                    'name': location_components.get('locality', 'Unknown'),
-                    'region': location_components.get('administrative_area_level_1', 'Unknown'),
-                    'country': location_components.get('country', 'Unknown'),
-                    'lat': lat,
-                    'lon': lon,
-                    'localtime': weather_data['location']['localtime']
-                },
-                'current': {
-                    'temp_c': weather_data['current']['temp_c'],
-                    'condition': {
-                        'text': weather_data['current']['condition']['text'],
-                        'icon': weather_data['current']['condition']['icon']
-                    },
-                    'wind_kph': weather_data['current']['wind_kph'],
-                    'humidity': weather_data['current']['humidity'],
-                    'feelslike_c': weather_data['current']['feelslike_c']
-                },
-                'forecast': {
-                    'forecastday': [
-                        {
-                            'date': day['date'],
-                            'day': {
-                                'maxtemp_c': day['day']['maxtemp_c'],
-                                'mintemp_c': day['day']['mintemp_c'],
-                                'condition': {
-                                    'text': day['day']['condition']['text'],
-                                    'icon': day['day']['condition']['icon']
-                                }
-                            }
-                        }
-                        for day in weather_data['forecast']['forecastday']
-                    ]
-                }
-            }
+        report, location_name = await load_weather_by_coordinates(lat, lon)
 
-            # Generate AI insights
-            try:
-                ai_summary = await generate_weather_summary(transformed_data)
-                ai_activities = await generate_activity_suggestions(transformed_data)
-                ai_clothing = await generate_clothing_recommendations(transformed_data)
-            except Exception as e:
-                print(f"Error generating AI insights: {e}")
-                ai_summary = None
-                ai_activities = None
-                ai_clothing = None
+        # Generate AI insights and fetch YouTube videos concurrently
+        enrichments = await gather_enrichments(report, location_name)
+
+        # Add additional data to response
+        return raw_json_response(
+            encode_weather(report, dumps(report), enrichments),
+            headers=await weather_cache_headers(report, enrichments)
+        )
+
+    except httpx.RequestError as e:
+        logger.error(f"Error fetching weather API: {e}")
+        raise HTTPException(status_code=503, detail="Weather service unavailable")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_weather_by_coordinates: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+# --- Stream Weather by Coordinates API Route (SSE) ---
+@app.get("/api/weather/coordinates/stream", dependencies=[Depends(rate_limited)])
+async def stream_weather_by_coordinates(
+    lat: float = Query(...),
+    lon: float = Query(...)
+):
+    try:
+        report, location_name = await load_weather_by_coordinates(lat, lon)
+    except httpx.RequestError as e:
+        logger.error(f"Error fetching weather API: {e}")
+        raise HTTPException(status_code=503, detail="Weather service unavailable")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in stream_weather_by_coordinates: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-            # Fetch YouTube videos
+    return sse_response(stream_weather_events(report, dumps(report), location_name))
+
+# --- Batch Weather API Route ---
+@app.post("/api/weather/batch")
+async def get_weather_batch(request: BatchWeatherRequest, http_request: Request):
+    """Resolves many locations in one call. Duplicates are fetched once, at most
+    BATCH_CONCURRENCY at a time. Each result carries either `data` or `error`."""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def resolve(location: BatchLocation) -> dict:
+        async with semaphore:
             try:
-                youtube_videos = await fetch_youtube_videos(location_components.get('locality', 'Unknown'))
+                if location.lat is not None:
+                    report, location_name = await load_weather_by_coordinates(location.lat, location.lon)
+                else:
+                    report, location_name = await load_weather_by_location(
+                        location.city, location.state, location.country
+                    )
+                enrichments = await gather_enrichments(
+                    report, location_name,
+                    include_ai=request.include_ai,
+                    include_youtube=request.include_youtube
+                )
+                # Encoded here so duplicates in the request share one encoding
+                return {'data': encode_weather(report, dumps(report), enrichments), 'error': None}
+            except HTTPException as e:
+                return {'data': None, 'error': e.detail}
+            except httpx.RequestError as e:
+                logger.error(f"Error fetching weather API in batch: {e}")
+                return {'data': None, 'error': "Weather service unavailable"}
             except Exception as e:
-                print(f"Error fetching YouTube videos: {e}")
-                youtube_videos = []
-            
-            # Add additional data to response
-            response_data = {
-                **transformed_data,
-                'latitude': lat,
-                'longitude': lon,
-                'ai_summary': ai_summary,
-                'ai_activities': ai_activities,
-                'ai_clothing': ai_clothing,
-                'youtube_videos': youtube_videos,
-                'map_api_key': GOOGLE_MAPS_API_KEY  # Add API key for map component only
-            }
-            
-            return response_data
+                logger.error(f"Error in get_weather_batch: {e}")
+                return {'data': None, 'error': "Internal server error"}
+
+    unique = {}
+    for location in request.locations:
+        unique.setdefault(location.dedup_key(), location)
+    # Each distinct location costs the client what a single weather request would
+    enforce_client_rate(http_request, len(unique))
+    resolved = dict(zip(unique, await asyncio.gather(*(resolve(loc) for loc in unique.values()))))
+
+    results = [
+        embed_raw(
+            {'query': location.model_dump(exclude_none=True), 'error': resolved[location.dedup_key()]['error']},
+            {'data': resolved[location.dedup_key()]['data']}
+        )
+        for location in request.locations
+    ]
+    errors = sum(1 for location in request.locations if resolved[location.dedup_key()]['error'] is not None)
+    return raw_json_response(extend_object(
+        b'{"results":[' + b",".join(results) + b"]}",
+        {'count': len(results), 'errors': errors}
+    ))
+
+# --- History Backfill API Route ---
+@app.post("/api/history/backfill", dependencies=[Depends(rate_limited)])
+async def backfill_weather_history(request: HistoryBackfillRequest):
+    """Pre-loads past dates for a location into the history store so browsing
+    them later never touches WeatherAPI. Dates in the future or the last two
+    days (not final yet everywhere) are skipped."""
+    location = request.location
+    try:
+        if location.lat is not None:
+            latitude, longitude = location.lat, location.lon
+        else:
+            resolved = await geocode_address(location.city, location.state, location.country)
+            if resolved is None:
+                raise HTTPException(status_code=400, detail=f"Location not found: {format_address(location.city, location.state, location.country)}")
+            latitude, longitude = resolved['lat'], resolved['lng']
+
+        result = await backfill_history(latitude, longitude, request.start_date, request.end_date)
+        return {'latitude': latitude, 'longitude': longitude, **result}
 
     except httpx.RequestError as e:
-        print(f"Error fetching weather API: {e}")
-        raise HTTPException(status_code=503, detail="Weather service unavailable")
+        logger.error(f"Error geocoding for history backfill: {e}")
+        raise HTTPException(status_code=503, detail="Geocoding service unavailable")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_weather_by_coordinates: {e}")
+        logger.error(f"Error in backfill_weather_history: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # --- Get All Searches API Route ---
 @app.get("/api/searches")
-async def get_searches():
-    print("Fetching all searches from database...")
+async def get_searches(
+    limit: int = Query(SEARCH_PAGE_DEFAULT, ge=1, le=SEARCH_PAGE_MAX),
+    cursor: str | None = Query(None),
+    city: str | None = Query(None),
+    country: str | None = Query(None),
+    start: datetime | None = Query(None),
+    end: datetime | None = Query(None),
+    fields: str | None = Query(None)
+):
+    """Newest-first page of searches. The cursor for the next page is returned
+    in the X-Next-Cursor header (absent on the last page)."""
+    logger.debug("Fetching searches from database...")
+    where = build_search_filter(city, country, start, end)
+    if cursor:
+        where = {'AND': [where, cursor_filter(decode_cursor(cursor))]}
+    selected = parse_search_fields(fields)
+
     try:
-        searches = await db.weathersearch.find_many(
-            order={'timestamp': 'desc'}
+        # Skip loading the weatherData blob entirely when it isn't requested
+        model = WeatherSearch if 'weatherData' in selected else WeatherSearchSummary
+        searches = await model.prisma().find_many(
+            where=where,
+            order=SEARCH_ORDER,
+            take=limit + 1
         )
-        result = [search.dict() for search in searches]
-        for item in result:
-            item['timestamp'] = item['timestamp'].isoformat()
-            # Prisma already parses JSON field to dict, no need for json.loads here
-            # Check if it's already a dict (it should be)
-            if not isinstance(item.get('weatherData'), dict):
-                 print(f"Warning: weatherData for search {item.get('id')} is not a dict: {type(item.get('weatherData'))}")
-                 # Attempt parsing if it's a string, otherwise set None
-                 if isinstance(item.get('weatherData'), str):
-                     try:
-                         item['weatherData'] = json.loads(item['weatherData'])
-                     except (json.JSONDecodeError, TypeError):
-                         item['weatherData'] = None
-                 else:
-                     item['weatherData'] = None
-
-        print(f"Found {len(result)} searches.")
-        return result # FastAPI handles JSON conversion
     except Exception as e:
-        print(f"Error retrieving searches: {e}")
-        return [] 
+        logger.error(f"Error retrieving searches: {e}")
+        return []
+
+    # Always revalidated; unchanged pages come back as 304 via the ETag
+    headers = {'Cache-Control': "no-cache"}
+    if len(searches) > limit:
+        searches = searches[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(searches[-1])
+
+    logger.debug(f"Found {len(searches)} searches.")
+    body = b"[" + b",".join(encode_search(search, selected) for search in searches) + b"]"
+    return raw_json_response(body, headers=headers)
+
+# --- Export Data API Route ---
+# Declared before /api/searches/{search_id} so "export" isn't captured as an id
+@app.get("/api/searches/export")
+async def export_searches(
+    format: str = Query("json", pattern="^(json|csv|ndjson)$"), # Default to json, validate format
+    gzip: bool = Query(False),
+    city: str | None = Query(None),
+    country: str | None = Query(None),
+    start: datetime | None = Query(None),
+    end: datetime | None = Query(None)
+):
+    """Streams the search history in fixed-size DB batches, so memory stays
+    bounded however many rows are exported."""
+    logger.debug(f"Exporting search data as {format}{' (gzip)' if gzip else ''}...")
+    where = build_search_filter(city, country, start, end)
+    model = EXPORT_MODELS[format]
+    try:
+        # Fetch the first batch up front so an empty export can still return a 404
+        first_batch = await fetch_export_batch(model, where, None)
+    except Exception as e:
+        logger.error(f"Error exporting search data: {e}")
+        raise HTTPException(status_code=500, detail="Error exporting search data")
+
+    if not first_batch:
+        return JSONResponse(content={"message": "No search data to export."}, status_code=404)
+
+    chunks = EXPORT_WRITERS[format](iter_export_batches(model, where, first_batch))
+    filename = f"weather_searches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 # --- Get Specific Search API Route ---
 @app.get("/api/searches/{search_id}")
 async def get_search(search_id: str): # Path parameter
-    print(f"Fetching search with ID: {search_id}")
+    logger.debug(f"Fetching search with ID: {search_id}")
     try:
         search = await db.weathersearch.find_unique(where={'id': search_id})
         if search:
-            result = search.dict()
-            result['timestamp'] = result['timestamp'].isoformat()
-            
-            # Prisma already parses JSON field to dict, no need for json.loads
-            wd_from_db = result.get('weatherData')
-            if not isinstance(wd_from_db, dict):
-                 print(f"--- View Search --- Warning: weatherData is not a dict: {type(wd_from_db)}")
-                 if isinstance(wd_from_db, str):
-                     try:
-                         result['weatherData'] = json.loads(wd_from_db)
-                     except (json.JSONDecodeError, TypeError):
-                         result['weatherData'] = None
-                 else:
-                     result['weatherData'] = None 
-
-            print("Search found.")
-            return result
+            logger.debug("Search found.")
+            return raw_json_response(
+                encode_search(search, set(SEARCH_FIELDS)),
+                headers={'Cache-Control': "no-cache"}
+            )
         else:
-            print("Search not found.")
+            logger.warning("Search not found.")
             raise HTTPException(status_code=404, detail="Search not found")
     except Exception as e:
-        print(f"Error retrieving search {search_id}: {e}")
+        logger.error(f"Error retrieving search {search_id}: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving search")
 
 # --- Update Search API Route ---
 @app.put("/api/searches/{search_id}")
 async def update_search(search_id: str, update_data: SearchUpdate):
-    print(f"Attempting to update search with ID: {search_id}")
+    logger.debug(f"Attempting to update search with ID: {search_id}")
     
     # Create a dictionary with only the fields that were provided
     update_payload = update_data.model_dump(exclude_unset=True)
@@ -491,6 +1004,11 @@ async def update_search(search_id: str, update_data: SearchUpdate):
     # Check if there's anything to update
     if not update_payload:
         raise HTTPException(status_code=400, detail="No update data provided.")
+    # Keep the filter keys in step with renamed locations
+    if update_payload.get('city'):
+        update_payload['cityKey'] = search_key(update_payload['city'])
+    if update_payload.get('country'):
+        update_payload['countryKey'] = search_key(update_payload['country'])
         
     try:
         updated_search = await db.weathersearch.update(
@@ -502,132 +1020,30 @@ async def update_search(search_id: str, update_data: SearchUpdate):
             # Should not happen if update raises error on not found, but belts and suspenders
             raise HTTPException(status_code=404, detail="Search not found for update.")
 
-        print(f"Search {search_id} updated successfully.")
-        # Prepare response (similar to get_search)
-        result = updated_search.dict()
-        result['timestamp'] = result['timestamp'].isoformat()
-        # Ensure weatherData is dict (it should be after update)
-        if not isinstance(result.get('weatherData'), dict):
-            if isinstance(result.get('weatherData'), str):
-                 try: result['weatherData'] = json.loads(result['weatherData'])
-                 except: result['weatherData'] = None
-            else: result['weatherData'] = None
-                
-        return result
+        logger.info(f"Search {search_id} updated successfully.")
+        # Prepare response (same shape as get_search)
+        return raw_json_response(encode_search(updated_search, set(SEARCH_FIELDS)))
 
     except RecordNotFoundError:
-        print(f"Search {search_id} not found for update.")
+        logger.warning(f"Search {search_id} not found for update.")
         raise HTTPException(status_code=404, detail="Search not found")
     except Exception as e:
-        print(f"Error updating search {search_id}: {e}")
+        logger.error(f"Error updating search {search_id}: {e}")
         raise HTTPException(status_code=500, detail="Error updating search")
 
 # --- Delete Search API Route ---
 @app.delete("/api/searches/{search_id}")
 async def delete_search(search_id: str): # Path parameter
-    print(f"Attempting to delete search with ID: {search_id}")
+    logger.debug(f"Attempting to delete search with ID: {search_id}")
     try:
         await db.weathersearch.delete(where={'id': search_id})
-        print("Search deleted successfully.")
+        logger.info("Search deleted successfully.")
         # Use Response for 204 No Content
         return Response(status_code=204) 
     except RecordNotFoundError:
         # Prisma raises specific error if record not found for delete
-        print("Search not found for deletion.")
+        logger.warning("Search not found for deletion.")
         raise HTTPException(status_code=404, detail="Search not found")
     except Exception as e:
-        print(f"Error deleting search {search_id}: {e}")
+        logger.error(f"Error deleting search {search_id}: {e}")
         raise HTTPException(status_code=500, detail="Error deleting search")
-
-# --- Export Data API Route ---
-@app.get("/api/searches/export")
-async def export_searches(format: str = Query("json", pattern="^(json|csv)$")): # Default to json, validate format
-    print(f"Exporting search data as {format}...")
-    try:
-        searches = await db.weathersearch.find_many(
-            order={'timestamp': 'desc'}
-        )
-        
-        if not searches:
-            return JSONResponse(content={"message": "No search data to export."}, status_code=404)
-        
-        # Prepare data (convert to dicts)
-        data_to_export = [s.dict() for s in searches]
-        
-        if format == "json":
-            # Clean up data for JSON export (convert datetime, remove sensitive data)
-            for item in data_to_export:
-                item['timestamp'] = item['timestamp'].isoformat()
-                # Keep weatherData as is (already dict)
-                if not isinstance(item.get('weatherData'), dict):
-                     item['weatherData'] = None # Ensure it's serializable
-                
-                # Remove sensitive data from weatherData if it exists
-                if item.get('weatherData'):
-                    weather_data = item['weatherData']
-                    # Remove API keys and sensitive information
-                    weather_data.pop('google_maps_api_key', None)
-                    # Keep only essential weather information
-                    weather_data = {
-                        'location': weather_data.get('location'),
-                        'current': weather_data.get('current'),
-                        'forecast': weather_data.get('forecast'),
-                        'ai_summary': weather_data.get('ai_summary'),
-                        'ai_activities': weather_data.get('ai_activities'),
-                        'ai_clothing': weather_data.get('ai_clothing'),
-                        'youtube_videos': weather_data.get('youtube_videos')
-                    }
-                    item['weatherData'] = weather_data
-            
-            # Create JSON string
-            json_string = json.dumps(data_to_export, indent=2)
-            filename = f"weather_searches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            # Use Response to set headers for download
-            return Response(
-                content=json_string,
-                media_type="application/json",
-                headers={'Content-Disposition': f'attachment; filename="{filename}'}
-            )
-
-        elif format == "csv":
-            # Select and flatten fields for CSV
-            csv_data = []
-            # Define headers explicitly for consistent order
-            headers = ['id', 'timestamp', 'city', 'state', 'country', 
-                       'weather_location', 'weather_condition', 'weather_temp_c', 'weather_feelslike_c']
-            csv_data.append(headers)
-            
-            for item in data_to_export:
-                weather_data = item.get('weatherData') or {}
-                location = weather_data.get('location') or {}
-                current = weather_data.get('current') or {}
-                condition = current.get('condition') or {}
-                
-                row = [
-                    item.get('id'),
-                    item.get('timestamp').isoformat() if item.get('timestamp') else '',
-                    item.get('city'),
-                    item.get('state'),
-                    item.get('country'),
-                    location.get('name'),
-                    condition.get('text'),
-                    current.get('temp_c'),
-                    current.get('feelslike_c')
-                ]
-                csv_data.append(row)
-            
-            # Create CSV in memory
-            stream = StringIO()
-            writer = csv.writer(stream)
-            writer.writerows(csv_data)
-            stream.seek(0) # Rewind the stream
-            
-            filename = f"weather_searches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            # Use StreamingResponse for CSV download
-            response = StreamingResponse(iter([stream.getvalue()]), media_type="text/csv")
-            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-            return response
-
-    except Exception as e:
-        print(f"Error exporting search data: {e}")
-        raise HTTPException(status_code=500, detail="Error exporting search data")
\ No newline at end of file
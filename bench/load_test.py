@@ -0,0 +1,258 @@
+"""Drives the API at a fixed concurrency and reports throughput and latency
+percentiles per endpoint.
+
+With --spawn, starts bench/stub_upstreams.py and the app (uvicorn) as child
+processes wired to each other, so a run needs nothing but DATABASE_URL:
+
+    python bench/load_test.py --spawn --concurrency 32 --duration 30 \
+        --endpoints weather,coordinates --stub "--latency-ms 80 --latency openrouter=1200"
+
+Save a run with --output baseline.json and compare a later one with --baseline baseline.json.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+COUNTRIES = ["Norway", "Japan", "Brazil", "Kenya", "Canada", "India", "Spain", "Chile"]
+
+
+# --- Workload ---
+def build_locations(count: int, seed: int) -> list[dict]:
+    """A fixed pool of synthetic locations; the stubs geocode them deterministically."""
+    rng = random.Random(seed)
+    return [
+        {
+            'city': f"Benchville {index}",
+            'state': f"Region {index % 50}",
+            'country': COUNTRIES[index % len(COUNTRIES)],
+            'lat': round(rng.uniform(-60, 70), 4),
+            'lon': round(rng.uniform(-180, 180), 4),
+        }
+        for index in range(count)
+    ]
+
+
+def location_params(location: dict) -> dict:
+    return {'city': location['city'], 'state': location['state'], 'country': location['country']}
+
+
+def coordinate_params(location: dict) -> dict:
+    return {'lat': location['lat'], 'lon': location['lon']}
+
+
+# Endpoint name -> builder(location, rng) returning (method, path, request kwargs)
+ENDPOINTS = {
+    'weather': lambda loc, rng: ("GET", "/api/weather", {'params': location_params(loc)}),
+    'weather_stream': lambda loc, rng: ("GET", "/api/weather/stream", {'params': location_params(loc)}),
+    'coordinates': lambda loc, rng: ("GET", "/api/weather/coordinates", {'params': coordinate_params(loc)}),
+    'coordinates_stream': lambda loc, rng: ("GET", "/api/weather/coordinates/stream",
+                                            {'params': coordinate_params(loc)}),
+    'batch': lambda loc, rng: ("POST", "/api/weather/batch", {'json': {
+        'locations': [location_params(loc)] + [coordinate_params(loc) for _ in range(rng.randint(1, 4))]
+    }}),
+    'searches': lambda loc, rng: ("GET", "/api/searches", {'params': {'limit': 20}}),
+}
+
+
+# --- Load Generation ---
+async def worker(client: httpx.AsyncClient, endpoints: list[str], locations: list[dict], rng: random.Random,
+                 stop_at: float, results: dict, record: bool):
+    while time.perf_counter() < stop_at:
+        name = rng.choice(endpoints)
+        method, path, kwargs = ENDPOINTS[name](rng.choice(locations), rng)
+        started = time.perf_counter()
+        try:
+            # Streaming endpoints are timed to the last byte, like a browser would see them
+            async with client.stream(method, path, **kwargs) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if record:
+            samples = results.setdefault(name, {'latencies': [], 'errors': 0})
+            samples['latencies'].append(time.perf_counter() - started)
+            samples['errors'] += not ok
+
+
+async def run_load(target: str, endpoints: list[str], locations: list[dict], concurrency: int,
+                   duration: float, warmup: float, seed: int) -> tuple[dict, float]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=target, limits=limits, timeout=60.0) as client:
+        if warmup > 0:
+            await asyncio.gather(*(
+                worker(client, endpoints, locations, random.Random(seed + index),
+                       time.perf_counter() + warmup, {}, record=False)
+                for index in range(concurrency)
+            ))
+        results: dict = {}
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, endpoints, locations, random.Random(seed + 1000 + index),
+                   started + duration, results, record=True)
+            for index in range(concurrency)
+        ))
+        return results, time.perf_counter() - started
+
+
+# --- Reporting ---
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(results: dict, elapsed: float) -> dict:
+    summary = {}
+    for name, samples in sorted(results.items()):
+        latencies = sorted(samples['latencies'])
+        summary[name] = {
+            'requests': len(latencies),
+            'errors': samples['errors'],
+            'rps': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        }
+    return summary
+
+
+def print_report(summary: dict, baseline: dict | None):
+    columns = ('requests', 'errors', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+    print(f"{'endpoint':<20}" + "".join(f"{column:>12}" for column in columns))
+    for name, row in summary.items():
+        print(f"{name:<20}" + "".join(
+            f"{row[column]:>12.1f}" if isinstance(row[column], float) else f"{row[column]:>12}"
+            for column in columns
+        ))
+        previous = (baseline or {}).get(name)
+        if previous:
+            deltas = []
+            for column in ('rps', 'p50_ms', 'p99_ms'):
+                if previous[column]:
+                    deltas.append(f"{column} {100 * (row[column] - previous[column]) / previous[column]:+.1f}%")
+            print(f"{'  vs baseline':<20}{', '.join(deltas)}")
+
+
+# --- Process Management ---
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def spawn(args: argparse.Namespace) -> list[subprocess.Popen]:
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stub = subprocess.Popen(
+        [sys.executable, str(ROOT / "bench" / "stub_upstreams.py"), "--port", str(args.stub_port),
+         *shlex.split(args.stub)],
+    )
+    wait_until_ready(f"{stub_url}/_stats", stub)
+
+    env = {
+        **os.environ,
+        'GOOGLE_BASE_URL': stub_url,
+        'WEATHERAPI_BASE_URL': stub_url,
+        'OPENROUTER_BASE_URL': stub_url,
+        'YOUTUBE_BASE_URL': stub_url,
+        # Any non-empty key enables the corresponding code path
+        'GOOGLE_MAPS_API_KEY': 'bench',
+        'WEATHER_API_KEY': 'bench',
+        'OPENROUTER_API_KEY': 'bench',
+        'YOUTUBE_API_KEY': 'bench',
+        'PREFETCH_ENABLED': 'false',
+        # The load generator is a single client; don't rate limit it
+        'CLIENT_RATE_PER_SECOND': os.getenv('CLIENT_RATE_PER_SECOND', '0'),
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.app_port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    processes = [stub, app]
+    try:
+        wait_until_ready(f"http://127.0.0.1:{args.app_port}/metrics", app)
+    except SystemExit:
+        stop(processes)
+        raise
+    return processes
+
+
+def stop(processes: list[subprocess.Popen]):
+    for process in reversed(processes):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default=None, help="Base URL of a running app (default: the spawned one)")
+    parser.add_argument("--endpoints", default="weather,coordinates",
+                        help=f"Comma-separated mix to request, from: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds run first to fill caches")
+    parser.add_argument("--locations", type=int, default=200,
+                        help="Distinct locations to draw from; fewer means more cache hits")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--spawn", action="store_true", help="Start the stub upstreams and the app")
+    parser.add_argument("--stub", default="", help="Extra arguments for stub_upstreams.py when spawning")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--output", help="Write the summary as JSON to this path")
+    parser.add_argument("--baseline", help="Summary JSON from an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown)}")
+    baseline = json.loads(Path(args.baseline).read_text())['endpoints'] if args.baseline else None
+
+    processes = spawn(args) if args.spawn else []
+    target = args.target or f"http://127.0.0.1:{args.app_port}"
+    try:
+        results, elapsed = asyncio.run(run_load(
+            target, endpoints, build_locations(args.locations, args.seed),
+            args.concurrency, args.duration, args.warmup, args.seed
+        ))
+    finally:
+        stop(processes)
+
+    summary = summarize(results, elapsed)
+    print(f"{target}  concurrency={args.concurrency}  duration={elapsed:.1f}s  locations={args.locations}")
+    print_report(summary, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'endpoints': summary,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Local stand-ins for Google Geocoding, WeatherAPI, OpenRouter and YouTube.
+
+Serves every upstream path the backend calls from one process, so the app can
+be benchmarked without network access or API quota. Point the backend at it with
+GOOGLE_BASE_URL / WEATHERAPI_BASE_URL / OPENROUTER_BASE_URL / YOUTUBE_BASE_URL.
+
+Responses are deterministic for a given input (coordinates are derived from a
+hash of the address), so repeated runs exercise the same cache behaviour.
+
+Usage:
+    python bench/stub_upstreams.py --port 9100 --latency-ms 80 --jitter-ms 20 \
+        --latency openrouter=1200 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from datetime import date, datetime, timedelta
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+UPSTREAMS = ("google", "weatherapi", "openrouter", "youtube")
+
+CONDITIONS = [
+    ("Sunny", "//cdn.weatherapi.com/weather/64x64/day/113.png"),
+    ("Partly cloudy", "//cdn.weatherapi.com/weather/64x64/day/116.png"),
+    ("Overcast", "//cdn.weatherapi.com/weather/64x64/day/122.png"),
+    ("Light rain", "//cdn.weatherapi.com/weather/64x64/day/296.png"),
+    ("Moderate snow", "//cdn.weatherapi.com/weather/64x64/day/332.png"),
+]
+
+
+class StubConfig:
+    """Latency and failure injection, per upstream."""
+
+    def __init__(self, latency_ms: dict, jitter_ms: float, error_rate: dict, timeout_rate: float, seed: int):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.random = random.Random(seed)
+        self.calls = {name: 0 for name in UPSTREAMS}
+        self.errors = {name: 0 for name in UPSTREAMS}
+
+    async def delay(self, upstream: str):
+        """Sleeps for the configured latency. Returns an error response to send instead, if one is injected."""
+        self.calls[upstream] += 1
+        if self.random.random() < self.timeout_rate:
+            # Longer than any client timeout in http_client.UPSTREAM_PROFILES
+            await asyncio.sleep(60)
+        latency = self.latency_ms[upstream] + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(latency, 0) / 1000)
+        if self.random.random() < self.error_rate[upstream]:
+            self.errors[upstream] += 1
+            return JSONResponse({"error": {"message": "Injected failure"}}, status_code=503)
+        return None
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha1(text.lower().encode()).digest()[:8], "big")
+
+
+def _components(city: str, state: str, country: str) -> list[dict]:
+    return [
+        {"long_name": city, "short_name": city, "types": ["locality", "political"]},
+        {"long_name": state, "short_name": state, "types": ["administrative_area_level_1", "political"]},
+        {"long_name": country, "short_name": country[:2].upper(), "types": ["country", "political"]},
+    ]
+
+
+def geocode_payload(params) -> dict:
+    if "latlng" in params:
+        lat, lng = (float(value) for value in params["latlng"].split(","))
+        city, state, country = f"Town {abs(round(lat, 1))}", "Stub State", "Stubland"
+    else:
+        parts = [part.strip() for part in params.get("address", "").split(",")]
+        city, state, country = (parts + ["", "", ""])[:3]
+        if city.lower().startswith("nowhere"):
+            return {"status": "ZERO_RESULTS", "results": []}
+        rng = random.Random(_seed(params.get("address", "")))
+        lat, lng = round(rng.uniform(-60, 70), 6), round(rng.uniform(-180, 180), 6)
+    return {
+        "status": "OK",
+        "results": [{
+            "formatted_address": f"{city}, {state}, {country}",
+            "geometry": {"location": {"lat": lat, "lng": lng}},
+            "address_components": _components(city, state, country),
+        }],
+    }
+
+
+def forecast_payload(params) -> dict:
+    lat, lon = (float(value) for value in params.get("q", "0,0").split(","))
+    days = int(params.get("days", 5))
+    start = date.fromisoformat(params["dt"]) if params.get("dt") else date.today()
+    rng = random.Random(_seed(f"{lat},{lon},{start}"))
+    current = rng.choice(CONDITIONS)
+    temp = round(rng.uniform(-10, 35), 1)
+    forecastday = []
+    for offset in range(days):
+        condition = rng.choice(CONDITIONS)
+        low = round(temp - rng.uniform(2, 8), 1)
+        forecastday.append({
+            "date": (start + timedelta(days=offset)).isoformat(),
+            "day": {
+                "maxtemp_c": round(low + rng.uniform(4, 12), 1),
+                "mintemp_c": low,
+                "avgtemp_c": round(low + 3, 1),
+                "maxwind_kph": round(rng.uniform(0, 40), 1),
+                "totalprecip_mm": round(rng.uniform(0, 10), 1),
+                "avghumidity": rng.randint(20, 95),
+                "daily_chance_of_rain": rng.randint(0, 100),
+                "uv": rng.randint(0, 11),
+                "condition": {"text": condition[0], "icon": condition[1]},
+            },
+            # Real responses carry 24 hourly entries; keep the payload a realistic size
+            "hour": [
+                {"time": f"{start + timedelta(days=offset)} {hour:02d}:00", "temp_c": round(low + hour / 3, 1),
+                 "condition": {"text": condition[0], "icon": condition[1]}, "chance_of_rain": rng.randint(0, 100)}
+                for hour in range(24)
+            ],
+        })
+    return {
+        "location": {
+            "name": "Stub", "region": "", "country": "Stubland", "lat": lat, "lon": lon,
+            "tz_id": "UTC", "localtime": datetime.utcnow().strftime("%Y-%m-%d %H:%M"),
+        },
+        "current": {
+            "temp_c": temp,
+            "feelslike_c": round(temp - rng.uniform(0, 4), 1),
+            "condition": {"text": current[0], "icon": current[1]},
+            "wind_kph": round(rng.uniform(0, 40), 1),
+            "humidity": rng.randint(20, 95),
+        },
+        "forecast": {"forecastday": forecastday},
+    }
+
+
+def history_payload(params) -> dict:
+    # history.json: dt through end_dt, and no current conditions
+    start = date.fromisoformat(params["dt"])
+    end = date.fromisoformat(params["end_dt"]) if params.get("end_dt") else start
+    payload = forecast_payload({**params, "days": (end - start).days + 1})
+    del payload["current"]
+    return payload
+
+
+def chat_payload(body: dict) -> dict:
+    if body.get("response_format", {}).get("type") == "json_object":
+        content = json.dumps({
+            "summary": "Mild and mostly dry with a light breeze.",
+            "activities": ["Walk along the riverside", "Visit the old town market"],
+            "clothing": ["Light jacket", "Comfortable walking shoes"],
+        })
+    else:
+        content = "- Stub insight one\n- Stub insight two"
+    return {"id": "stub", "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+
+def youtube_payload(params) -> dict:
+    rng = random.Random(_seed(params.get("q", "")))
+    return {
+        "items": [
+            {
+                "id": {"kind": "youtube#video", "videoId": f"stub{rng.randrange(10**8):08d}"},
+                "snippet": {
+                    "title": f"{params.get('q', '')} #{index + 1}",
+                    "thumbnails": {"default": {"url": "https://i.ytimg.com/vi/stub/default.jpg"}},
+                },
+            }
+            for index in range(int(params.get("maxResults", 3)))
+        ]
+    }
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    stub = FastAPI(title="Upstream stubs")
+
+    @stub.get("/maps/api/geocode/json")
+    async def geocode(request: Request):
+        return await config.delay("google") or geocode_payload(request.query_params)
+
+    @stub.get("/v1/forecast.json")
+    async def forecast(request: Request):
+        return await config.delay("weatherapi") or forecast_payload(request.query_params)
+
+    @stub.get("/v1/history.json")
+    async def history(request: Request):
+        return await config.delay("weatherapi") or history_payload(request.query_params)
+
+    @stub.post("/api/v1/chat/completions")
+    async def chat(request: Request):
+        return await config.delay("openrouter") or chat_payload(await request.json())
+
+    @stub.get("/youtube/v3/search")
+    async def youtube(request: Request):
+        return await config.delay("youtube") or youtube_payload(request.query_params)
+
+    @stub.get("/_stats")
+    async def stats():
+        return {"calls": config.calls, "errors": config.errors}
+
+    return stub
+
+
+def _per_upstream(default: float, overrides: list[str], option: str) -> dict:
+    values = {name: default for name in UPSTREAMS}
+    for override in overrides:
+        name, _, value = override.partition("=")
+        if name not in values:
+            raise SystemExit(f"{option}: unknown upstream '{name}' (expected one of {', '.join(UPSTREAMS)})")
+        values[name] = float(value)
+    return values
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency for every upstream")
+    parser.add_argument("--latency", action="append", default=[], metavar="UPSTREAM=MS",
+                        help="Per-upstream latency override, e.g. openrouter=1500 (repeatable)")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Uniform +/- jitter added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 503")
+    parser.add_argument("--errors", action="append", default=[], metavar="UPSTREAM=RATE",
+                        help="Per-upstream error rate override (repeatable)")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of calls that hang for 60s")
+    parser.add_argument("--seed", type=int, default=1234)
+    return parser.parse_args(argv)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency_ms=_per_upstream(args.latency_ms, args.latency, "--latency"),
+        jitter_ms=args.jitter_ms,
+        error_rate=_per_upstream(args.error_rate, args.errors, "--errors"),
+        timeout_rate=args.timeout_rate,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
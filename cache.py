@@ -0,0 +1,475 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps caches per process; "sqlite" shares them between the workers
+# on a host through one SQLite file
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', 'data/cache.sqlite3')
+# Shared entries are also kept in process for up to this long, so hot keys
+# don't pay a SQLite read and a decode on every hit
+SHARED_CACHE_LOCAL_TTL = float(os.getenv('SHARED_CACHE_LOCAL_TTL', '5'))
+# A worker holding a single-flight lease longer than this is presumed dead
+SHARED_CACHE_LEASE_SECONDS = float(os.getenv('SHARED_CACHE_LEASE_SECONDS', '30'))
+SHARED_CACHE_POLL_INTERVAL = 0.05
+# How long a SQLite call waits on another worker's write lock before giving up
+# (reads then count as misses, writes are dropped); kept short so a busy file
+# degrades to the per-process tier instead of stalling requests
+SHARED_CACHE_BUSY_TIMEOUT = float(os.getenv('SHARED_CACHE_BUSY_TIMEOUT', '0.25'))
+# Expired and over-limit rows are pruned once every this many writes
+SHARED_CACHE_PRUNE_EVERY = 200
+
+_MISSING = object()
+
+# Every TTLCache created in the process, for metrics
+_registry: list = []
+
+
+class TTLCache:
+    """Size-bounded in-memory LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache", register: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        if register:
+            _registry.append(self)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def peek(self, key, default=None):
+        """Like get(), without counting as a lookup or refreshing recency."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def ttl_remaining(self, key) -> float:
+        """Seconds until the entry expires; 0 when missing or already expired.
+        Does not count as a lookup or refresh recency."""
+        entry = self._data.get(key)
+        if entry is None:
+            return 0.0
+        return max(0.0, entry[0] - time.monotonic())
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MemoryCache:
+    """TTLCache behind the awaitable interface of SharedCache, so modules using
+    make_cache() don't care which backend they got."""
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache", register: bool = True):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name=name, register=register)
+        self.name = name
+
+    async def get(self, key, default=None):
+        return self._cache.get(key, default)
+
+    async def set(self, key, value, ttl: float | None = None):
+        self._cache.set(key, value, ttl)
+
+    async def peek(self, key):
+        return self._cache.peek(key)
+
+    async def ttl_remaining(self, key) -> float:
+        return self._cache.ttl_remaining(key)
+
+    async def contains(self, key) -> bool:
+        return key in self._cache
+
+    async def incr(self, key, amount: int, ttl: float | None = None) -> int:
+        """Adds `amount` to a counter entry and returns the new total. The TTL
+        applies when the counter is created; increments keep its expiry."""
+        remaining = self._cache.ttl_remaining(key)
+        value = self._cache.get(key, 0) + amount if remaining > 0 else amount
+        self._cache.set(key, value, remaining if remaining > 0 else ttl)
+        return value
+
+    async def delete(self, key):
+        self._cache.delete(key)
+
+    async def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class SharedCache:
+    """Cache stored in a SQLite file that every worker process on the host
+    opens, so one worker's upstream call warms them all.
+
+    Values are JSON-encoded; expiry is wall-clock time so all processes agree
+    on it. Reads go through a small in-process tier first (never past the
+    entry's own expiry). SQLite calls block, so they run on the process's
+    cache thread and are awaited; a statement that can't get the database
+    within SHARED_CACHE_BUSY_TIMEOUT fails and is treated as a miss.
+    maxsize is enforced every SHARED_CACHE_PRUNE_EVERY writes, not on each one.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache", path: str = SHARED_CACHE_PATH,
+                 register: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = TTLCache(maxsize=maxsize, ttl=SHARED_CACHE_LOCAL_TTL, name=name, register=False)
+        self._writes = 0
+        self._size = 0  # Live rows as of the last prune; counting on every scrape is too slow
+        if register:
+            _registry.append(self)
+
+    def _key(self, key) -> str:
+        return dumps(key).decode()
+
+    async def _run(self, fn, *args):
+        """Runs fn(db, *args) on the cache thread."""
+        def call():
+            return fn(_connection(self.path), *args)
+        return await asyncio.get_running_loop().run_in_executor(_executor(), call)
+
+    async def get(self, key, default=None):
+        value = await self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    async def _lookup(self, key):
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        try:
+            row = await self._run(_select_entry, self.name, self._key(key))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"Shared cache '{self.name}' read failed: {e}")
+            row = None
+        remaining = row[1] - time.time() if row is not None else 0
+        if remaining <= 0:
+            return _MISSING
+        value = loads(row[0])
+        self._local.set(key, value, min(remaining, SHARED_CACHE_LOCAL_TTL))
+        return value
+
+    async def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._local.set(key, value, min(ttl, SHARED_CACHE_LOCAL_TTL))
+        # Pruning on the first write too gives stats() a size early on
+        prune = self._writes % SHARED_CACHE_PRUNE_EVERY == 0
+        self._writes += 1
+        try:
+            size = await self._run(
+                _write_entry, self.name, self._key(key), dumps(value), time.time() + ttl,
+                self.maxsize if prune else None
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"Shared cache '{self.name}' write failed: {e}")
+            return
+        if size is not None:
+            self._size = size
+
+    async def ttl_remaining(self, key) -> float:
+        """Seconds until the entry expires; 0 when missing or already expired.
+        Does not count as a lookup."""
+        try:
+            row = await self._run(_select_entry, self.name, self._key(key))
+        except sqlite3.Error:
+            return self._local.ttl_remaining(key)
+        return max(0.0, row[1] - time.time()) if row is not None else 0.0
+
+    async def contains(self, key) -> bool:
+        return key in self._local or await self.ttl_remaining(key) > 0
+
+    async def incr(self, key, amount: int, ttl: float | None = None) -> int | None:
+        """Atomically adds `amount` to a counter entry shared by all workers and
+        returns the new total, or None if the database was unavailable. The TTL
+        applies when the counter is created; increments keep its expiry."""
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            value, expires_at = await self._run(
+                _increment_entry, self.name, self._key(key), amount, time.time() + ttl
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"Shared cache '{self.name}' increment failed: {e}")
+            return None
+        self._local.set(key, value, min(expires_at - time.time(), SHARED_CACHE_LOCAL_TTL))
+        return value
+
+    async def delete(self, key):
+        self._local.delete(key)
+        await self._run(_delete_entries, self.name, self._key(key))
+
+    async def clear(self):
+        self._local.clear()
+        await self._run(_delete_entries, self.name, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": self._size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    # --- Cross-process leases for SingleFlight ---
+    async def try_lease(self, key, owner: str) -> bool:
+        """Claims `key` for `owner` unless another live worker holds it."""
+        try:
+            return await self._run(_claim_lease, self._lease_name(key), owner)
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache '{self.name}' lease failed: {e}")
+            return True  # Fall back to fetching on our own
+
+    async def release_lease(self, key, owner: str):
+        try:
+            await self._run(_release_lease, self._lease_name(key), owner)
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache '{self.name}' lease release failed: {e}")
+
+    async def peek(self, key):
+        """Like get(), without counting as a lookup; None when missing."""
+        value = await self._lookup(key)
+        return None if value is _MISSING else value
+
+    def _lease_name(self, key) -> str:
+        return f"{self.name}:{self._key(key)}"
+
+
+# --- SQLite access; everything below runs on the cache thread ---
+def _select_entry(db: sqlite3.Connection, namespace: str, key: str):
+    return db.execute(
+        "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+    ).fetchone()
+
+
+def _write_entry(db: sqlite3.Connection, namespace: str, key: str, value: bytes, expires_at: float,
+                 prune_to: int | None) -> int | None:
+    """Stores one entry. With prune_to, also drops expired rows and then the
+    soonest-expiring ones beyond it, and returns the namespace's row count."""
+    with db:
+        db.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, expires_at)
+        )
+    if prune_to is None:
+        return None
+    with db:
+        db.execute("DELETE FROM entries WHERE namespace = ? AND expires_at <= ?", (namespace, time.time()))
+        db.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key IN ("
+            "SELECT key FROM entries WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (namespace, namespace, prune_to)
+        )
+    return db.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+
+def _increment_entry(db: sqlite3.Connection, namespace: str, key: str, amount: int,
+                     expires_at: float) -> tuple[int, float]:
+    with db:
+        # Explicit, because the implicit BEGIN only comes before the first write
+        db.execute("BEGIN IMMEDIATE")
+        row = _select_entry(db, namespace, key)
+        if row is not None and row[1] > time.time():
+            value, expires_at = loads(row[0]) + amount, row[1]
+        else:
+            value = amount
+        db.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, dumps(value), expires_at)
+        )
+    return value, expires_at
+
+
+def _delete_entries(db: sqlite3.Connection, namespace: str, key: str | None):
+    with db:
+        if key is None:
+            db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        else:
+            db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+def _claim_lease(db: sqlite3.Connection, name: str, owner: str) -> bool:
+    now = time.time()
+    with db:
+        db.execute("DELETE FROM leases WHERE name = ? AND expires_at <= ?", (name, now))
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+            (name, owner, now + SHARED_CACHE_LEASE_SECONDS)
+        )
+    return cursor.rowcount == 1
+
+
+def _release_lease(db: sqlite3.Connection, name: str, owner: str):
+    with db:
+        db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+# One cache thread and connection per (process, file); created lazily so forked
+# workers never share them. A single thread keeps the event loop free of SQLite
+# calls and means each connection is only ever used from one thread.
+_executors: dict = {}
+_connections: dict = {}
+
+
+def _executor() -> ThreadPoolExecutor:
+    pid = os.getpid()
+    executor = _executors.get(pid)
+    if executor is None:
+        executor = _executors[pid] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+    return executor
+
+
+def _connection(path: str) -> sqlite3.Connection:
+    key = (os.getpid(), path)
+    db = _connections.get(key)
+    if db is None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Writes run in BEGIN IMMEDIATE transactions (`with db:`) so lease checks are atomic
+        db = sqlite3.connect(path, timeout=SHARED_CACHE_BUSY_TIMEOUT, isolation_level="IMMEDIATE")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        _connections[key] = db
+    return db
+
+
+def make_cache(maxsize: int, ttl: float, name: str, register: bool = True):
+    """Cache for results worth sharing between workers; per-process unless
+    CACHE_BACKEND=sqlite. Both backends are awaited. register=False keeps it
+    out of the cache metrics (for counters and other non-cache state)."""
+    if CACHE_BACKEND == "sqlite":
+        return SharedCache(maxsize=maxsize, ttl=ttl, name=name, register=register)
+    return MemoryCache(maxsize=maxsize, ttl=ttl, name=name, register=register)
+
+
+def close_shared_caches():
+    pid = os.getpid()
+    executor = _executors.pop(pid, None)
+    if executor is None:
+        return
+
+    def close():
+        for key in [key for key in _connections if key[0] == pid]:
+            _connections.pop(key).close()
+    executor.submit(close)
+    executor.shutdown(wait=True)
+
+
+def all_cache_stats() -> list[dict]:
+    return [cache.stats() for cache in _registry]
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight task.
+
+    Given a SharedCache, calls are also coalesced across worker processes:
+    only the worker holding the key's lease calls fn(); the others wait for
+    the value to show up in the cache (fn() is expected to store it there).
+    """
+
+    def __init__(self, cache: SharedCache | MemoryCache | None = None):
+        self._inflight: dict = {}
+        self._shared = cache if isinstance(cache, SharedCache) else None
+        self._owner = uuid.uuid4().hex
+
+    async def do(self, key, fn):
+        """Awaits fn() once per key; concurrent callers share its result or error."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn() if self._shared is None else self._leased(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one caller disconnecting doesn't cancel the shared request
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def _leased(self, key, fn):
+        cache = self._shared
+        deadline = time.monotonic() + SHARED_CACHE_LEASE_SECONDS
+        while not await cache.try_lease(key, self._owner):
+            # Another worker is fetching; wait for its result, or for its lease
+            # to be released without one and take over
+            await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+            value = await cache.peek(key)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                break
+        try:
+            return await fn()
+        finally:
+            await cache.release_lease(key, self._owner)
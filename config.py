@@ -0,0 +1,11 @@
+import os
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Boolean environment setting; unset falls back to `default`."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in _TRUE
@@ -0,0 +1,94 @@
+import math
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from cache import SingleFlight, make_cache
+from http_client import request as upstream_request
+
+WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
+WEATHER_FORECAST_PATH = "/v1/forecast.json"
+# forecast.json only takes dt from today onwards; earlier days come from here
+WEATHER_HISTORY_PATH = "/v1/history.json"
+
+# Grid size in degrees; 0.02 is roughly 2 km, finer than WeatherAPI's own resolution
+FORECAST_CELL_DEGREES = float(os.getenv('FORECAST_CELL_DEGREES', '0.02'))
+# WeatherAPI refreshes current conditions every 10-15 minutes
+FORECAST_CACHE_TTL = float(os.getenv('FORECAST_CACHE_TTL', '600'))
+FORECAST_CACHE_SIZE = int(os.getenv('FORECAST_CACHE_SIZE', '5000'))
+
+_cache = make_cache(maxsize=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL, name="forecast")
+_flights = SingleFlight(_cache)
+
+
+def forecast_cell(lat: float, lon: float) -> tuple[int, int]:
+    """Index of the grid cell containing a point."""
+    return math.floor(lat / FORECAST_CELL_DEGREES), math.floor(lon / FORECAST_CELL_DEGREES)
+
+
+def cell_center(cell: tuple[int, int]) -> tuple[float, float]:
+    return (
+        round((cell[0] + 0.5) * FORECAST_CELL_DEGREES, 4),
+        round((cell[1] + 0.5) * FORECAST_CELL_DEGREES, 4),
+    )
+
+
+def forecast_key(lat: float, lon: float, days: int, dt: str | None) -> tuple:
+    return (*forecast_cell(lat, lon), days, dt)
+
+
+async def fetch_forecast(lat: float, lon: float, days: int = 5, dt: str | None = None,
+                         force_refresh: bool = False) -> dict:
+    """Returns the raw WeatherAPI forecast.json payload for the grid cell around (lat, lon).
+    Every point in a cell is served the forecast for the cell center, so nearby
+    requests share cache entries and concurrent misses share one upstream call.
+    force_refresh skips the cache read (used by the prefetcher to renew entries)."""
+    key = forecast_key(lat, lon, days, dt)
+    if not force_refresh:
+        cached = await _cache.get(key)
+        if cached is not None:
+            return cached
+
+    async def fetch():
+        data = await fetch_cell_upstream(key[:2], days, dt)
+        await _cache.set(key, data)
+        return data
+
+    return await _flights.do(key, fetch)
+
+
+def upstream_query(cell: tuple[int, int], days: int, dt: str | None) -> tuple[str, dict]:
+    """WeatherAPI path and params for a grid cell's center. Dates before today
+    (UTC) go to history.json, covering `days` days from dt but not past
+    yesterday; anything else to forecast.json."""
+    center_lat, center_lon = cell_center(cell)
+    params = {"key": WEATHER_API_KEY, "q": f"{center_lat},{center_lon}"}
+    today = datetime.now(timezone.utc).date()
+    start = date.fromisoformat(dt) if dt else today
+    if start >= today:
+        params["days"] = days
+        if dt:
+            params["dt"] = dt
+        return WEATHER_FORECAST_PATH, params
+
+    params["dt"] = dt
+    end = min(start + timedelta(days=days - 1), today - timedelta(days=1))
+    if end > start:
+        params["end_dt"] = end.isoformat()
+    return WEATHER_HISTORY_PATH, params
+
+
+async def fetch_cell_upstream(cell: tuple[int, int], days: int, dt: str | None) -> dict:
+    """Uncached WeatherAPI call for a grid cell's center. history.json payloads
+    have no `current` block; transform_weather fills it from the day's summary."""
+    path, params = upstream_query(cell, days, dt)
+    response = await upstream_request("weatherapi", "GET", path, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+async def forecast_ttl_remaining(lat: float, lon: float, days: int = 5, dt: str | None = None) -> float:
+    return await _cache.ttl_remaining(forecast_key(lat, lon, days, dt))
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,331 @@
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import unicodedata
+import heapq
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', os.path.join(os.path.dirname(__file__), 'data', 'gazetteer.bin'))
+# Points farther than this from every known place are left to the Google fallback
+GAZETTEER_MAX_DISTANCE_KM = float(os.getenv('GAZETTEER_MAX_DISTANCE_KM', '50'))
+
+# --- File Format ---
+# Little-endian, fixed-width sections first so each can be viewed in place:
+#   header | lat f32[n] | lon f32[n] | population u32[n] | cell_start u32[rows*cols+1]
+#   | text_offset u32[n+1] | key_order u32[n] | key_offset u32[n+1] | text | keys | pad to 4
+#   | heavy_count u32 | top_k u32 | heavy_offset u32[h+1] | heavy_top u32[h*top_k] | heavy_text
+# Places are sorted by grid cell; cell_start[c]:cell_start[c+1] are the places in cell c.
+# text holds "name\x1fadmin1\x1fcountry" per place, addressed by text_offset.
+# keys holds each place's normalized name in sorted order (for prefix search);
+# key_order maps a sorted position back to its place.
+# Prefixes matching more than HEAVY_PREFIX_MATCHES names ("heavy" ones, mostly
+# one or two letters) get their top_k most populous places precomputed, so no
+# prefix query ever ranks more than HEAVY_PREFIX_MATCHES places at runtime.
+MAGIC = b"GZTR"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIfII") # magic, version, reserved, count, cell_degrees, rows, cols
+FIELD_SEPARATOR = "\x1f"
+KM_PER_DEGREE = 111.195
+HEAVY_PREFIX_MATCHES = 256
+HEAVY_PREFIX_TOP_K = 20
+NO_PLACE = 2**32 - 1
+
+
+def normalize_text(value: str | None) -> str:
+    """Lowercases, strips diacritics and collapses whitespace."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", stripped.casefold()).strip(" ,")
+
+
+def _cell_index(lat: float, lon: float, cell_degrees: float, rows: int, cols: int) -> tuple[int, int]:
+    row = min(rows - 1, max(0, int((lat + 90.0) // cell_degrees)))
+    col = int((lon + 180.0) // cell_degrees) % cols
+    return row, col
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Equirectangular approximation; accurate to well under 1% at city distances
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    if x > math.pi:
+        x -= 2 * math.pi
+    elif x < -math.pi:
+        x += 2 * math.pi
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+def write_gazetteer(path: str, places: list[tuple[float, float, str, str, str, int]], cell_degrees: float = 1.0):
+    """Writes (lat, lon, name, admin1, country, population) places in the format read by Gazetteer."""
+    rows, cols = math.ceil(180 / cell_degrees), math.ceil(360 / cell_degrees)
+    keyed = sorted(
+        (_cell_index(lat, lon, cell_degrees, rows, cols), lat, lon, name, admin1, country, population)
+        for lat, lon, name, admin1, country, population in places
+    )
+
+    cell_start = [0] * (rows * cols + 1)
+    for (row, col), *_ in keyed:
+        cell_start[row * cols + col + 1] += 1
+    for index in range(1, len(cell_start)):
+        cell_start[index] += cell_start[index - 1]
+
+    text = bytearray()
+    text_offsets = [0]
+    for _, _, _, name, admin1, country, _ in keyed:
+        text += FIELD_SEPARATOR.join((name, admin1, country)).encode()
+        text_offsets.append(len(text))
+
+    names = sorted((normalize_text(entry[3]), index) for index, entry in enumerate(keyed))
+    keys = bytearray()
+    key_offsets = [0]
+    for key, _ in names:
+        keys += key.encode()
+        key_offsets.append(len(keys))
+
+    count = len(keyed)
+    with open(path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, 0, count, cell_degrees, rows, cols))
+        out.write(struct.pack(f"<{count}f", *(entry[1] for entry in keyed)))
+        out.write(struct.pack(f"<{count}f", *(entry[2] for entry in keyed)))
+        out.write(struct.pack(f"<{count}I", *(min(entry[6], 2**32 - 1) for entry in keyed)))
+        out.write(struct.pack(f"<{len(cell_start)}I", *cell_start))
+        out.write(struct.pack(f"<{len(text_offsets)}I", *text_offsets))
+        out.write(struct.pack(f"<{count}I", *(index for _, index in names)))
+        out.write(struct.pack(f"<{len(key_offsets)}I", *key_offsets))
+        out.write(text)
+        out.write(keys)
+        out.write(b"\0" * (-(len(text) + len(keys)) % 4))
+
+        heavy = _heavy_prefixes(names, [entry[6] for entry in keyed])
+        heavy_text = bytearray()
+        heavy_offsets = [0]
+        heavy_top = []
+        for prefix, top in heavy:
+            heavy_text += prefix.encode()
+            heavy_offsets.append(len(heavy_text))
+            heavy_top.extend(top + [NO_PLACE] * (HEAVY_PREFIX_TOP_K - len(top)))
+        out.write(struct.pack("<II", len(heavy), HEAVY_PREFIX_TOP_K))
+        out.write(struct.pack(f"<{len(heavy_offsets)}I", *heavy_offsets))
+        out.write(struct.pack(f"<{len(heavy_top)}I", *heavy_top))
+        out.write(heavy_text)
+
+
+def _heavy_prefixes(names: list[tuple[str, int]], population: list[int]) -> list[tuple[str, list[int]]]:
+    """(prefix, most populous place indices) for every prefix with too many matches."""
+    heavy = []
+    length = 1
+    while True:
+        groups: dict[str, list[int]] = {}
+        for key, index in names:
+            if len(key) >= length:
+                groups.setdefault(key[:length], []).append(index)
+        found = [(prefix, indices) for prefix, indices in groups.items() if len(indices) > HEAVY_PREFIX_MATCHES]
+        if not found:
+            return heavy
+        for prefix, indices in found:
+            top = heapq.nlargest(HEAVY_PREFIX_TOP_K, indices, key=population.__getitem__)
+            heavy.append((prefix, top))
+        length += 1
+
+
+class Gazetteer:
+    """Nearest-place lookup over a memory-mapped gazetteer file.
+
+    Nothing is parsed at load time: the arrays are read straight from the
+    mapping, so startup cost is independent of file size and pages are shared
+    between worker processes. Lookups scan the query's grid cell and widen
+    ring by ring until no closer place can exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, _, count, cell_degrees, rows, cols = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} gazetteer file")
+        self.count, self.cell_degrees, self.rows, self.cols = count, cell_degrees, rows, cols
+
+        offset = HEADER.size
+        self._lats = self._section(offset, count, "f")
+        offset += 4 * count
+        self._lons = self._section(offset, count, "f")
+        offset += 4 * count
+        self._population = self._section(offset, count, "I")
+        offset += 4 * count
+        self._cell_start = self._section(offset, rows * cols + 1, "I")
+        offset += 4 * (rows * cols + 1)
+        self._text_offsets = self._section(offset, count + 1, "I")
+        offset += 4 * (count + 1)
+        self._key_order = self._section(offset, count, "I")
+        offset += 4 * count
+        self._key_offsets = self._section(offset, count + 1, "I")
+        self._text_base = offset + 4 * (count + 1)
+        self._keys_base = self._text_base + self._text_offsets[count]
+        self._heavy = self._load_heavy(self._keys_base + self._key_offsets[count])
+        self.hits = 0
+        self.misses = 0
+
+    def _load_heavy(self, offset: int) -> dict[str, list[int]]:
+        """The precomputed heavy-prefix table is small, so it is read into a dict once."""
+        offset += -offset % 4
+        heavy_count, top_k = struct.unpack_from("<II", self._mmap, offset)
+        offset += 8
+        offsets = struct.unpack_from(f"<{heavy_count + 1}I", self._mmap, offset)
+        offset += 4 * (heavy_count + 1)
+        top = struct.unpack_from(f"<{heavy_count * top_k}I", self._mmap, offset)
+        text_base = offset + 4 * heavy_count * top_k
+        heavy = {}
+        for i in range(heavy_count):
+            prefix = self._mmap[text_base + offsets[i]:text_base + offsets[i + 1]].decode()
+            heavy[prefix] = [index for index in top[i * top_k:(i + 1) * top_k] if index != NO_PLACE]
+        return heavy
+
+    def _section(self, offset: int, length: int, format: str) -> memoryview:
+        return self._view[offset:offset + 4 * length].cast(format)
+
+    def close(self):
+        for name in ("_lats", "_lons", "_population", "_cell_start", "_text_offsets",
+                     "_key_order", "_key_offsets", "_view"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def place(self, index: int) -> tuple[str, str, str]:
+        start = self._text_base + self._text_offsets[index]
+        end = self._text_base + self._text_offsets[index + 1]
+        name, admin1, country = bytes(self._view[start:end]).decode().split(FIELD_SEPARATOR)
+        return name, admin1, country
+
+    def location(self, index: int) -> tuple[float, float]:
+        return self._lats[index], self._lons[index]
+
+    def population(self, index: int) -> int:
+        return self._population[index]
+
+    def _key(self, position: int) -> str:
+        start = self._keys_base + self._key_offsets[position]
+        return bytes(self._view[start:self._keys_base + self._key_offsets[position + 1]]).decode()
+
+    def prefix_matches(self, prefix: str) -> range:
+        """Sorted-key positions whose normalized name starts with `prefix`
+        (already normalized). Map them to places with place_at()."""
+        if not prefix:
+            return range(0)
+        start = bisect_left(range(self.count), prefix, key=self._key)
+        # First string greater than every string with this prefix
+        successor = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        end = start + bisect_left(range(start, self.count), successor, key=self._key)
+        return range(start, end)
+
+    def place_at(self, position: int) -> int:
+        return self._key_order[position]
+
+    def most_populous(self, prefix: str, limit: int) -> list[int]:
+        """Indices of the `limit` most populous places whose name starts with `prefix`."""
+        if prefix in self._heavy and limit <= len(self._heavy[prefix]):
+            return self._heavy[prefix][:limit]
+        places = (self.place_at(position) for position in self.prefix_matches(prefix))
+        return heapq.nlargest(limit, places, key=self.population)
+
+    def nearest(self, lat: float, lon: float, max_km: float = GAZETTEER_MAX_DISTANCE_KM) -> tuple[int, float] | None:
+        """(index, distance_km) of the closest place within max_km, or None."""
+        row, col = _cell_index(lat, lon, self.cell_degrees, self.rows, self.cols)
+        best, best_km = None, max_km
+        max_ring = max(self.rows, self.cols) // 2
+        for ring in range(max_ring + 1):
+            if ring > 1:
+                # Closest any cell in this ring can be; longitude shrinks towards the poles
+                edge_lat = min(89.9, abs(lat) + ring * self.cell_degrees)
+                bound = (ring - 1) * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+                if 2 * ring + 1 >= self.cols:
+                    # Every longitude is already covered; only latitude distance grows
+                    bound = (ring - 1) * self.cell_degrees * KM_PER_DEGREE
+                if bound > best_km:
+                    break
+            # Rows farther than best_km in latitude can't hold a closer place
+            row_span = int(best_km / (self.cell_degrees * KM_PER_DEGREE)) + 1
+            for r, c in self._ring_cells(row, col, ring, row_span):
+                for index in range(self._cell_start[r * self.cols + c], self._cell_start[r * self.cols + c + 1]):
+                    km = _distance_km(lat, lon, self._lats[index], self._lons[index])
+                    if km <= best_km:
+                        best, best_km = index, km
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return best, best_km
+
+    def _ring_cells(self, row: int, col: int, ring: int, row_span: int):
+        if ring == 0:
+            yield row, col
+            return
+        seen = set()
+        for dr in range(-min(ring, row_span), min(ring, row_span) + 1):
+            for dc in (range(-ring, ring + 1) if abs(dr) == ring else (-ring, ring)):
+                r = row + dr
+                if 0 <= r < self.rows:
+                    cell = (r, (col + dc) % self.cols)
+                    if cell not in seen:
+                        seen.add(cell)
+                        yield cell
+
+    def components(self, lat: float, lon: float) -> dict | None:
+        """Google-style address components for the nearest place, or None."""
+        found = self.nearest(lat, lon)
+        if found is None:
+            return None
+        name, admin1, country = self.place(found[0])
+        components = {'locality': name, 'country': country}
+        if admin1:
+            components['administrative_area_level_1'] = admin1
+        return components
+
+
+# --- Shared Instance ---
+_gazetteer: Gazetteer | None = None
+_load_attempted = False
+
+
+def load() -> Gazetteer | None:
+    """Opens GAZETTEER_PATH once. A missing file disables the offline lookup."""
+    global _gazetteer, _load_attempted
+    if _load_attempted:
+        return _gazetteer
+    _load_attempted = True
+    if not os.path.exists(GAZETTEER_PATH):
+        logger.warning(f"No gazetteer at {GAZETTEER_PATH}; reverse geocoding will use Google. "
+                       "Build one with scripts/build_gazetteer.py.")
+        return None
+    try:
+        _gazetteer = Gazetteer(GAZETTEER_PATH)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"Could not load gazetteer {GAZETTEER_PATH}: {e}")
+        return None
+    logger.info(f"Gazetteer loaded: {_gazetteer.count} places from {GAZETTEER_PATH}")
+    return _gazetteer
+
+
+def close():
+    global _gazetteer, _load_attempted
+    if _gazetteer is not None:
+        _gazetteer.close()
+    _gazetteer = None
+    _load_attempted = False
+
+
+def stats() -> dict | None:
+    if _gazetteer is None:
+        return None
+    return {'places': _gazetteer.count, 'hits': _gazetteer.hits, 'misses': _gazetteer.misses}
@@ -0,0 +1,172 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from prisma import Json
+from prisma.models import GeocodeCache
+
+import gazetteer
+from gazetteer import normalize_text
+from cache import SingleFlight, make_cache
+from config import env_flag
+from http_client import request as upstream_request
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+GEOCODING_PATH = "/maps/api/geocode/json"
+
+# Place coordinates practically never change, so keep them for a long time.
+GEOCODE_MEMORY_TTL = float(os.getenv('GEOCODE_MEMORY_TTL', str(24 * 3600)))
+GEOCODE_DB_TTL_DAYS = int(os.getenv('GEOCODE_DB_TTL_DAYS', '30'))
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', '10000'))
+# 3 decimals is ~110 m, well inside a single locality
+REVERSE_KEY_PRECISION = 3
+# Ask Google when the offline gazetteer has no place near the point
+REVERSE_GEOCODE_GOOGLE_FALLBACK = env_flag('REVERSE_GEOCODE_GOOGLE_FALLBACK', True)
+
+_memory = make_cache(maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_MEMORY_TTL, name="geocode")
+_flights = SingleFlight(_memory)
+
+
+# --- Key Normalization ---
+def normalize_location(city: str, state: str | None, country: str) -> str:
+    return "|".join(normalize_text(part) for part in (city, state, country))
+
+
+def format_address(city: str, state: str | None, country: str) -> str:
+    """"City, State, Country" from the parts that are present (state is optional)."""
+    return ", ".join(part for part in (city, state, country) if part)
+
+
+def reverse_key(lat: float, lon: float) -> str:
+    return f"{round(lat, REVERSE_KEY_PRECISION)},{round(lon, REVERSE_KEY_PRECISION)}"
+
+
+def _extract_components(result: dict) -> dict:
+    components = {}
+    for component in result.get('address_components', []):
+        for type in component['types']:
+            components[type] = component['long_name']
+    return components
+
+
+# --- Persistent Tier ---
+async def _load_persisted(key: str) -> dict | None:
+    try:
+        record = await GeocodeCache.prisma().find_unique(where={'key': key})
+    except Exception as e:
+        logger.error(f"Error reading geocode cache for '{key}': {e}")
+        return None
+    if record is None or record.expiresAt <= datetime.now(timezone.utc):
+        return None
+    return record.payload
+
+
+async def _persist(key: str, payload: dict):
+    expires_at = datetime.now(timezone.utc) + timedelta(days=GEOCODE_DB_TTL_DAYS)
+    try:
+        await GeocodeCache.prisma().upsert(
+            where={'key': key},
+            data={
+                'create': {'key': key, 'payload': Json(payload), 'expiresAt': expires_at},
+                'update': {'payload': Json(payload), 'expiresAt': expires_at},
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error writing geocode cache for '{key}': {e}")
+
+
+async def _cached_lookup(key: str, fetch, force_refresh: bool = False) -> dict | None:
+    """Memory -> database -> Google. Only successful lookups are cached;
+    concurrent misses for a key share one lookup. force_refresh skips the
+    memory read (used by the prefetcher to renew entries before they expire)."""
+    if not force_refresh:
+        cached = await _memory.get(key)
+        if cached is not None:
+            return cached
+
+    async def load():
+        persisted = await _load_persisted(key)
+        if persisted is not None:
+            await _memory.set(key, persisted)
+            return persisted
+
+        payload = await fetch()
+        if payload is not None:
+            await _memory.set(key, payload)
+            await _persist(key, payload)
+        return payload
+
+    return await _flights.do(key, load)
+
+
+# --- Public API ---
+async def geocode_address(city: str, state: str | None, country: str,
+                          force_refresh: bool = False) -> dict | None:
+    """Resolves a city/state/country to coordinates.
+    Returns None when Google cannot find the location."""
+    key = f"fwd:{normalize_location(city, state, country)}"
+
+    async def fetch():
+        response = await upstream_request(
+            "google", "GET", GEOCODING_PATH,
+            params={
+                "address": format_address(city, state, country),
+                "key": GOOGLE_MAPS_API_KEY
+            }
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get('status') != 'OK' or not data.get('results'):
+            return None
+        result = data['results'][0]
+        return {
+            'lat': result['geometry']['location']['lat'],
+            'lng': result['geometry']['location']['lng'],
+            'formatted_address': result.get('formatted_address'),
+            'components': _extract_components(result),
+        }
+
+    return await _cached_lookup(key, fetch, force_refresh)
+
+
+async def reverse_geocode(lat: float, lon: float) -> dict:
+    """Returns the address components (locality, admin area, country...) for a point.
+    Answered from the offline gazetteer when a place is close enough, otherwise
+    by Google (if the fallback is enabled). An empty dict means no match."""
+    offline = gazetteer.load()
+    if offline is not None:
+        components = offline.components(lat, lon)
+        if components is not None:
+            return components
+    if not REVERSE_GEOCODE_GOOGLE_FALLBACK:
+        return {}
+
+    key = f"rev:{reverse_key(lat, lon)}"
+
+    async def fetch():
+        response = await upstream_request(
+            "google", "GET", GEOCODING_PATH,
+            params={
+                "latlng": f"{lat},{lon}",
+                "key": GOOGLE_MAPS_API_KEY
+            }
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get('status') != 'OK' or not data.get('results'):
+            return None
+        return {'components': _extract_components(data['results'][0])}
+
+    payload = await _cached_lookup(key, fetch)
+    return payload['components'] if payload else {}
+
+
+async def address_ttl_remaining(city: str, state: str | None, country: str) -> float:
+    """Seconds the forward lookup can still be served from memory (0 if not cached)."""
+    return await _memory.ttl_remaining(f"fwd:{normalize_location(city, state, country)}")
+
+
+def cache_stats() -> dict:
+    return _memory.stats()
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import os
+
+HTTP_COMPRESSION_MIN_BYTES = int(os.getenv('HTTP_COMPRESSION_MIN_BYTES', '1024'))
+HTTP_GZIP_LEVEL = int(os.getenv('HTTP_GZIP_LEVEL', '6'))
+HTTP_BROTLI_QUALITY = int(os.getenv('HTTP_BROTLI_QUALITY', '5'))
+# Past-date weather never changes once stored
+HISTORY_MAX_AGE = int(os.getenv('HISTORY_MAX_AGE', '86400'))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def cache_control(max_age: float) -> str:
+    """Shared caches may keep the response until our own cache entry expires;
+    once it has, clients must revalidate (cheap with the ETag)."""
+    max_age = int(max_age)
+    return f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison; compressed variants share their base tag."""
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        for suffix in ('-gzip"', '-br"'):
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)] + '"'
+        if candidate == etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Best supported content coding the client accepts; brotli when available."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+
+
+class HTTPCachingMiddleware:
+    """Adds strong ETags, answers matching If-None-Match with 304 and compresses
+    bodies above HTTP_COMPRESSION_MIN_BYTES.
+
+    Only responses sent in one piece are touched: streamed ones (SSE, exports)
+    pass through untouched so events are never buffered and pre-gzipped exports
+    aren't compressed twice. Cache-Control itself is set by the routes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = {key.decode().lower(): value.decode() for key, value in scope["headers"]}
+        conditional = scope["method"] == "GET"
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if message.get("more_body", False):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            for outgoing in self._finish(start_message, message.get("body", b""), request_headers, conditional):
+                await send(outgoing)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _finish(self, start: dict, body: bytes, request_headers: dict, conditional: bool) -> list[dict]:
+        headers = [(key, value) for key, value in start["headers"]]
+        names = {key.decode().lower() for key, _ in headers}
+        content_type = next((value.decode() for key, value in headers if key.lower() == b"content-type"), "")
+        compressible = content_type.startswith(COMPRESSIBLE_TYPES) and "content-encoding" not in names
+
+        etag = None
+        if conditional and start["status"] == 200 and "etag" not in names:
+            etag = strong_etag(body)
+            if etag_matches(request_headers.get("if-none-match", ""), etag):
+                kept = [(key, value) for key, value in headers
+                        if key.lower() not in (b"content-length", b"content-type")]
+                kept.append((b"etag", etag.encode()))
+                if compressible:
+                    kept.append((b"vary", b"Accept-Encoding"))
+                return [
+                    {"type": "http.response.start", "status": 304, "headers": kept},
+                    {"type": "http.response.body", "body": b""},
+                ]
+
+        if compressible:
+            headers.append((b"vary", b"Accept-Encoding"))
+            encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+            if encoding is not None and len(body) >= HTTP_COMPRESSION_MIN_BYTES:
+                body = compress(body, encoding)
+                headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"content-length", str(len(body)).encode()))
+                if etag is not None:
+                    # A strong tag names exact bytes, so each coding gets its own
+                    etag = f'{etag[:-1]}-{encoding}"'
+        if etag is not None:
+            headers.append((b"etag", etag.encode()))
+
+        return [
+            {**start, "headers": headers},
+            {"type": "http.response.body", "body": body},
+        ]
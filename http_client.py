@@ -0,0 +1,168 @@
+import logging
+import os
+import time
+
+import httpx
+
+from admission import UpstreamLimiter, UpstreamOverloadedError
+from config import env_flag
+from metrics import UPSTREAM_DURATION, UPSTREAM_IN_FLIGHT, UPSTREAM_RESPONSES
+from resilience import CircuitOpenError, get_guard
+
+logger = logging.getLogger(__name__)
+
+# How long a call may wait for one of its upstream's concurrency slots before
+# being shed. Core data waits a little; enrichments give up almost at once.
+CORE_QUEUE_TIMEOUT = float(os.getenv("CORE_QUEUE_TIMEOUT", "2.0"))
+ENRICHMENT_QUEUE_TIMEOUT = float(os.getenv("ENRICHMENT_QUEUE_TIMEOUT", "0.25"))
+
+# --- Upstream Profiles ---
+# One pooled client per upstream so a slow provider can't exhaust the
+# connections another one needs. Timeouts mirror what each call used before.
+# `hedge` marks upstreams whose GETs are idempotent and free to duplicate
+# (YouTube searches cost quota, so they are never hedged).
+# `max_concurrency` caps calls in flight per upstream (admission control).
+# Base URLs can be overridden to point at the stubs in bench/.
+UPSTREAM_PROFILES = {
+    "google": {
+        "hedge": True,
+        "base_url": os.getenv("GOOGLE_BASE_URL", "https://maps.googleapis.com"),
+        "timeout": httpx.Timeout(15.0, connect=5.0),
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "max_concurrency": int(os.getenv("GOOGLE_MAX_CONCURRENCY", "20")),
+        "queue_timeout": CORE_QUEUE_TIMEOUT,
+    },
+    "weatherapi": {
+        "hedge": True,
+        "base_url": os.getenv("WEATHERAPI_BASE_URL", "http://api.weatherapi.com"),
+        "timeout": httpx.Timeout(15.0, connect=5.0),
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "max_concurrency": int(os.getenv("WEATHERAPI_MAX_CONCURRENCY", "20")),
+        "queue_timeout": CORE_QUEUE_TIMEOUT,
+    },
+    "openrouter": {
+        "hedge": False,
+        "base_url": os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai"),
+        "timeout": httpx.Timeout(30.0, connect=5.0),
+        "max_connections": 10,
+        "max_keepalive_connections": 5,
+        "max_concurrency": int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "10")),
+        "queue_timeout": ENRICHMENT_QUEUE_TIMEOUT,
+    },
+    "youtube": {
+        "hedge": False,
+        "base_url": os.getenv("YOUTUBE_BASE_URL", "https://www.googleapis.com"),
+        "timeout": httpx.Timeout(10.0, connect=5.0),
+        "max_connections": 10,
+        "max_keepalive_connections": 5,
+        "max_concurrency": int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "5")),
+        "queue_timeout": ENRICHMENT_QUEUE_TIMEOUT,
+    },
+}
+
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_limiters = {
+    name: UpstreamLimiter(name, profile["max_concurrency"], profile["queue_timeout"])
+    for name, profile in UPSTREAM_PROFILES.items()
+}
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 is opt-in and needs the optional `h2` package."""
+    if not env_flag("HTTP2_ENABLED"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed. Using HTTP/1.1.")
+        return False
+    return True
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    profile = UPSTREAM_PROFILES[name]
+    limits = httpx.Limits(
+        max_connections=profile["max_connections"],
+        max_keepalive_connections=profile["max_keepalive_connections"],
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=profile["base_url"],
+        timeout=profile["timeout"],
+        limits=limits,
+        http2=_http2_enabled(),
+    )
+
+
+async def startup():
+    """Creates the pooled clients. Called from the FastAPI lifespan hook."""
+    for name in UPSTREAM_PROFILES:
+        if name not in _clients:
+            _clients[name] = _build_client(name)
+    logger.info(f"HTTP clients ready for: {', '.join(_clients)}")
+
+
+async def shutdown():
+    """Closes every pooled client and releases their connections."""
+    for name, client in list(_clients.items()):
+        await client.aclose()
+        del _clients[name]
+    logger.info("HTTP clients closed.")
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Returns the shared client for an upstream, creating it lazily if needed
+    (e.g. when ai_service is used outside the FastAPI app)."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+async def request(name: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Sends a request to an upstream through its concurrency limit and circuit
+    breaker. Idempotent GETs to hedge-enabled upstreams are hedged once they run
+    past the latency percentile. Raises a resilience.UpstreamUnavailableError
+    when the call is refused without reaching the upstream."""
+    client = get_client(name)
+    hedge = method == "GET" and UPSTREAM_PROFILES[name]["hedge"]
+
+    attempts = 0
+
+    async def send():
+        # Each attempt takes its own slot, so hedging can't exceed the limit;
+        # a hedge only goes out if a slot is free
+        nonlocal attempts
+        attempts += 1
+        limiter = _limiters[name]
+        async with limiter if attempts == 1 else limiter.spare_slot():
+            started = time.perf_counter()
+            UPSTREAM_IN_FLIGHT.inc(name)
+            try:
+                return await client.request(method, url, **kwargs)
+            finally:
+                UPSTREAM_IN_FLIGHT.dec(name)
+                UPSTREAM_DURATION.observe(time.perf_counter() - started, name)
+
+    try:
+        response = await get_guard(name).call(send, hedge=hedge)
+    except UpstreamOverloadedError:
+        UPSTREAM_RESPONSES.inc(name, "shed")
+        raise
+    except CircuitOpenError:
+        UPSTREAM_RESPONSES.inc(name, "circuit_open")
+        raise
+    except httpx.RequestError:
+        UPSTREAM_RESPONSES.inc(name, "error")
+        raise
+    UPSTREAM_RESPONSES.inc(name, str(response.status_code))
+    return response
+
+
+def limiter_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
@@ -0,0 +1,215 @@
+import asyncio
+import email.utils
+import itertools
+import logging
+import os
+import time
+
+import httpx
+
+from admission import background_work
+from resilience import UpstreamUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Calls in flight to OpenRouter at once; keep at or below OPENROUTER_MAX_CONCURRENCY
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+# Distinct prompts waiting or running; more are refused rather than queued
+LLM_QUEUE_SIZE = int(os.getenv('LLM_QUEUE_SIZE', '500'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+# Backoff for a 429 without Retry-After, doubled on each retry
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '1.0'))
+# A Retry-After longer than this fails the call instead of holding it
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '30'))
+
+
+class LLMQueueFullError(UpstreamUnavailableError):
+    """Raised when LLM_QUEUE_SIZE prompts are already pending."""
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    """Retry-After as seconds from now; it may be delta-seconds or an HTTP date."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class _Job:
+    __slots__ = ("key", "send", "on_response", "priority", "seq", "future", "waiters", "attempts", "started")
+
+    def __init__(self, key: str, send, on_response, priority: int, seq: int):
+        self.key = key
+        self.send = send
+        self.on_response = on_response
+        self.priority = priority
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Nobody may be left to read an error; don't let asyncio log it as unretrieved
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.waiters = 0
+        self.attempts = 0
+        self.started = False
+
+
+class LLMDispatcher:
+    """Process-wide scheduler for OpenRouter calls.
+
+    A fixed pool of workers drains a priority queue, so interactive prompts
+    overtake prefetch work and bursts never exceed LLM_MAX_CONCURRENCY calls.
+    Identical prompts submitted while one is pending share its response. A 429
+    pauses the whole pool for the Retry-After period (the rate limit is per
+    account, not per call) and the prompt is retried at the front of its queue.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._jobs: dict[str, _Job] = {}
+        self._workers: list[asyncio.Task] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self.in_flight = 0
+        self.counts = {'sent': 0, 'deduplicated': 0, 'rate_limited': 0, 'rejected': 0, 'abandoned': 0}
+
+    async def start(self):
+        if self._workers and not self._workers[0].done():
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self._jobs.values():
+            job.future.cancel()
+        self._jobs.clear()
+
+    async def submit(self, key: str, send, priority: int = INTERACTIVE, on_response=None) -> httpx.Response:
+        """Runs `send()` (a zero-arg coroutine factory returning the response)
+        through the pool. `key` identifies the prompt for deduplication.
+        `on_response(response)` is awaited once the final response arrives, even
+        if every caller has given up by then, so a paid-for reply can still be
+        cached. Raises LLMQueueFullError when too many prompts are pending."""
+        # Started lazily so ai_service also works outside the FastAPI app
+        await self.start()
+        job = self._jobs.get(key)
+        if job is not None:
+            self.counts['deduplicated'] += 1
+            if priority < job.priority and not job.started:
+                # Queued again at the new priority; the old entry is skipped when reached
+                job.priority, job.seq = priority, next(self._seq)
+                self._queue.put_nowait((job.priority, job.seq, job))
+        else:
+            if len(self._jobs) >= self.queue_size:
+                self.counts['rejected'] += 1
+                raise LLMQueueFullError(f"{len(self._jobs)} LLM prompts already pending")
+            job = _Job(key, send, on_response, priority, next(self._seq))
+            self._jobs[key] = job
+            self._queue.put_nowait((job.priority, job.seq, job))
+
+        if job.on_response is None:
+            job.on_response = on_response
+        job.waiters += 1
+        try:
+            # Shielded: one caller giving up must not cancel the call for the others
+            return await asyncio.shield(job.future)
+        finally:
+            job.waiters -= 1
+
+    async def _work(self):
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            entry = await self._queue.get()
+            job = entry[2]
+            if job.started or job.future.done():
+                continue
+            if time.monotonic() < self._paused_until:
+                # Rate limited while we were waiting for work; hold it until the pause ends
+                self._queue.put_nowait(entry)
+                continue
+            if job.waiters == 0:
+                # Every caller gave up (deadline or disconnect) before it was sent
+                self.counts['abandoned'] += 1
+                self._finish(job)
+                job.future.cancel()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: _Job):
+        job.started = True
+        self.in_flight += 1
+        self.counts['sent'] += 1
+        try:
+            # Workers are shared, so the caller's context doesn't reach the call
+            with background_work(job.priority == BACKGROUND):
+                response = await job.send()
+        except Exception as e:
+            self._finish(job)
+            job.future.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+
+        if response.status_code == 429:
+            self.counts['rate_limited'] += 1
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = LLM_RETRY_BASE_DELAY * 2 ** job.attempts
+            self._pause(min(delay, LLM_RETRY_MAX_DELAY))
+            if job.attempts < LLM_MAX_RETRIES and delay <= LLM_RETRY_MAX_DELAY:
+                job.attempts += 1
+                job.started = False
+                self._queue.put_nowait((job.priority, job.seq, job))
+                return
+        if job.on_response is not None:
+            try:
+                await job.on_response(response)
+            except Exception as e:
+                logger.error(f"LLM response handler failed: {e}")
+        self._finish(job)
+        job.future.set_result(response)
+
+    def _pause(self, seconds: float):
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            logger.warning(f"OpenRouter rate limited us; pausing LLM calls for {seconds:.1f}s.")
+            self._paused_until = until
+
+    def _finish(self, job: _Job):
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+
+    def stats(self) -> dict:
+        pending = {name: 0 for name in PRIORITY_NAMES.values()}
+        for job in self._jobs.values():
+            if not job.started:
+                pending[PRIORITY_NAMES[job.priority]] += 1
+        return {
+            **self.counts,
+            'pending': pending,
+            'in_flight': self.in_flight,
+            'paused_for': max(0.0, self._paused_until - time.monotonic()),
+        }
+
+
+dispatcher = LLMDispatcher(LLM_MAX_CONCURRENCY, LLM_QUEUE_SIZE)
@@ -0,0 +1,150 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; spans cache hits (sub-ms) up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_text(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in self._values.items():
+            lines.append(f"{self.name}{_labels_text(self.labels, values)} {total}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for values, value in self._values.items():
+            lines.append(f"{self.name}{_labels_text(self.labels, values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series: dict[tuple, list] = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _labels_text(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels_text(self.labels + ("le",), values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, values)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, values)} {series[-1]}")
+        return lines
+
+
+# --- Metric Definitions ---
+STAGE_DURATION = Histogram(
+    "weather_stage_duration_seconds",
+    "Time spent in each stage of a weather request (cache hits included).",
+    labels=("stage", "outcome"),
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to upstream providers.", labels=("upstream",)
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total",
+    "Upstream responses by status code ('error' for transport failures, 'circuit_open' when short-circuited, "
+    "'shed' when refused by the concurrency limit).",
+    labels=("upstream", "status"),
+)
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream calls currently in flight.", labels=("upstream",))
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to response headers for API requests.", labels=("method", "route", "status")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "API requests currently being handled.")
+
+METRICS = [STAGE_DURATION, UPSTREAM_DURATION, UPSTREAM_RESPONSES, UPSTREAM_IN_FLIGHT, HTTP_DURATION, HTTP_IN_FLIGHT]
+
+# Callables returning {"metric_name": (type, help, [(labels_dict, value), ...])},
+# sampled at scrape time for state owned by other modules (caches, breakers...)
+_collectors: list = []
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Records how long the wrapped block took under `stage`, split by outcome."""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage, outcome)
+
+
+async def timed(stage: str, awaitable):
+    """Awaits `awaitable` under stage_timer; handy inside asyncio.gather/create_task."""
+    with stage_timer(stage):
+        return await awaitable
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, (kind, help, samples) in collector().items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f"{name}{_labels_text(names, tuple(labels[n] for n in names))} {value}")
+    return "\n".join(lines) + "\n"
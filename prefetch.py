@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+
+from admission import background_work
+from ai_service import generate_weather_insights, has_cached_insights
+from config import env_flag
+from forecast import fetch_forecast, forecast_ttl_remaining
+from geocoding import address_ttl_remaining, geocode_address
+from llm_dispatcher import BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = env_flag('PREFETCH_ENABLED', True)
+PREFETCH_INTERVAL = float(os.getenv('PREFETCH_INTERVAL', '60'))
+PREFETCH_TOP_N = int(os.getenv('PREFETCH_TOP_N', '20'))
+PREFETCH_WINDOW_HOURS = int(os.getenv('PREFETCH_WINDOW_HOURS', '24'))
+# Geocodes and forecasts expiring within this many seconds are renewed ahead of time
+PREFETCH_REFRESH_AHEAD = float(os.getenv('PREFETCH_REFRESH_AHEAD', '120'))
+PREFETCH_AI = env_flag('PREFETCH_AI')
+# Upper bound on upstream calls (Google, WeatherAPI, OpenRouter) the prefetcher may make
+PREFETCH_MAX_UPSTREAM_PER_MINUTE = int(os.getenv('PREFETCH_MAX_UPSTREAM_PER_MINUTE', '30'))
+
+POPULAR_LOCATIONS_SQL = '''
+SELECT city, state, country, COUNT(*)::int AS searches
+FROM "WeatherSearch"
+WHERE "timestamp" >= NOW() - make_interval(hours => $1)
+GROUP BY city, state, country
+ORDER BY searches DESC
+LIMIT $2
+'''
+
+
+class UpstreamBudget:
+    """Token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class PrefetchScheduler:
+    """Keeps geocode, forecast and (optionally) AI caches warm for the most
+    searched locations, so popular requests never wait on an upstream."""
+
+    def __init__(self, db, load_weather):
+        # load_weather(city, state, country) -> (WeatherReport, location_name);
+        # passed in to avoid importing app.py from here
+        self._db = db
+        self._load_weather = load_weather
+        self._budget = UpstreamBudget(PREFETCH_MAX_UPSTREAM_PER_MINUTE)
+        self._task: asyncio.Task | None = None
+        self.refreshed = 0
+        self.skipped_for_budget = 0
+
+    async def start(self):
+        if PREFETCH_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Prefetch scheduler started (top {PREFETCH_TOP_N}, every {PREFETCH_INTERVAL}s).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def popular_locations(self) -> list[dict]:
+        return await self._db.query_raw(POPULAR_LOCATIONS_SQL, PREFETCH_WINDOW_HOURS, PREFETCH_TOP_N)
+
+    async def _run(self):
+        # Sheds of our calls mean users went first, not that the service is overloaded
+        with background_work():
+            await self._loop()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Prefetch cycle failed: {e}")
+            await asyncio.sleep(PREFETCH_INTERVAL)
+
+    async def run_once(self):
+        """Warms the most popular locations in rank order until the budget runs out."""
+        for row in await self.popular_locations():
+            try:
+                within_budget = await self._warm(row['city'], row['state'], row['country'])
+            except Exception as e:
+                logger.error(f"Prefetch failed for {row['city']}, {row['country']}: {e}")
+                continue
+            if not within_budget:
+                self.skipped_for_budget += 1
+                break
+
+    async def _warm(self, city: str, state: str, country: str) -> bool:
+        """Refreshes whatever is missing or about to expire. Returns False once
+        the upstream budget is exhausted."""
+        refresh_address = await address_ttl_remaining(city, state, country) < PREFETCH_REFRESH_AHEAD
+        if refresh_address and not self._budget.try_take():
+            return False
+        # Usually renewed from the GeocodeCache table; Google only once that has expired too
+        location = await geocode_address(city, state, country, force_refresh=refresh_address)
+        if location is None:
+            return True
+
+        if await forecast_ttl_remaining(location['lat'], location['lng']) < PREFETCH_REFRESH_AHEAD:
+            if not self._budget.try_take():
+                return False
+            await fetch_forecast(location['lat'], location['lng'], days=5, force_refresh=True)
+            self.refreshed += 1
+
+        if PREFETCH_AI:
+            report, _ = await self._load_weather(city, state, country)
+            if not await has_cached_insights(report):
+                if not self._budget.try_take():
+                    return False
+                await generate_weather_insights(report, priority=BACKGROUND)
+        return True
@@ -0,0 +1,6 @@
+# Partial models generated alongside the Prisma client (see `partial_type_generator`
+# in schema.prisma). Querying through a partial only selects its fields.
+from prisma.models import WeatherSearch
+
+# Search history rows without the weatherData JSON blob
+WeatherSearch.create_partial('WeatherSearchSummary', exclude={'weatherData'})
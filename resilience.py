@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import httpx
+
+from config import env_flag
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_WINDOW_SECONDS = float(os.getenv('CIRCUIT_WINDOW_SECONDS', '60'))
+CIRCUIT_MIN_REQUESTS = int(os.getenv('CIRCUIT_MIN_REQUESTS', '10'))
+CIRCUIT_ERROR_THRESHOLD = float(os.getenv('CIRCUIT_ERROR_THRESHOLD', '0.5'))
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+HEDGE_ENABLED = env_flag('HEDGE_ENABLED', True)
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.95'))
+# Hedging needs enough samples for the percentile to mean anything
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.05'))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailableError(httpx.RequestError):
+    """Base for calls we refuse to make (open circuit, full queue, shed load).
+
+    Subclasses httpx.RequestError so every existing `except httpx.RequestError`
+    handler degrades the same way it does for a network failure, without each
+    caller having to learn about the new failure modes."""
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+def _is_failure(response: httpx.Response) -> bool:
+    # 4xx means our request was bad, and 429 that we're over our rate limit;
+    # neither says the upstream is unhealthy (the LLM dispatcher backs off on 429)
+    return response.status_code >= 500
+
+
+class UpstreamGuard:
+    """Circuit breaker plus optional request hedging for one upstream.
+
+    Keeps a rolling window of (time, latency, ok) samples. When the error rate in
+    the window crosses CIRCUIT_ERROR_THRESHOLD the circuit opens and calls fail
+    fast for CIRCUIT_OPEN_SECONDS; then a single probe is let through (half-open)
+    and its outcome decides whether to close or re-open.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._samples: deque = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.hedged = 0
+
+    # --- Rolling window ---
+    def _prune(self, now: float):
+        while self._samples and self._samples[0][0] < now - CIRCUIT_WINDOW_SECONDS:
+            self._samples.popleft()
+
+    def record(self, latency: float, ok: bool):
+        now = time.monotonic()
+        self._samples.append((now, latency, ok))
+        self._prune(now)
+
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if ok:
+                self.state = CLOSED
+                self._samples.clear()
+                logger.info(f"Circuit for {self.name} closed.")
+            else:
+                self._open(now)
+            return
+
+        if self.state == CLOSED and len(self._samples) >= CIRCUIT_MIN_REQUESTS:
+            if self.error_rate() >= CIRCUIT_ERROR_THRESHOLD:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        logger.warning(f"Circuit for {self.name} opened (error rate {self.error_rate():.0%}).")
+
+    def error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, _, ok in self._samples if not ok) / len(self._samples)
+
+    def latency_percentile(self, percentile: float) -> float | None:
+        latencies = sorted(latency for _, latency, ok in self._samples if ok)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+    # --- Admission ---
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self._opened_at >= CIRCUIT_OPEN_SECONDS:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    # --- Calls ---
+    async def _attempt(self, send) -> httpx.Response:
+        started = time.monotonic()
+        ok = None
+        try:
+            response = await send()
+            ok = not _is_failure(response)
+            return response
+        except UpstreamUnavailableError:
+            # Refused before reaching the upstream (e.g. shed by its limiter)
+            raise
+        except httpx.RequestError:
+            ok = False
+            raise
+        finally:
+            if ok is not None:
+                self.record(time.monotonic() - started, ok=ok)
+            elif self.state == HALF_OPEN:
+                # Cancelled, refused or failed in our own code: that says nothing about
+                # the upstream's health, so let the next call probe instead
+                self._probe_in_flight = False
+
+    async def call(self, send, hedge: bool = False) -> httpx.Response:
+        """Runs `send()` (a zero-arg coroutine factory) under the breaker. With
+        hedge, a second identical attempt starts once the first has been running
+        longer than the upstream's HEDGE_PERCENTILE latency; the first to succeed wins."""
+        if not self.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"Circuit open for {self.name}; failing fast")
+
+        delay = self.latency_percentile(HEDGE_PERCENTILE) if hedge and HEDGE_ENABLED and self.state == CLOSED else None
+        if delay is None:
+            return await self._attempt(send)
+
+        primary = asyncio.ensure_future(self._attempt(send))
+        attempts = {primary}
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=max(delay, HEDGE_MIN_DELAY))
+            if not done:
+                self.hedged += 1
+                attempts.add(asyncio.ensure_future(self._attempt(send)))
+            while attempts:
+                done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                responses = [task.result() for task in done if task.exception() is None]
+                for response in responses:
+                    if not _is_failure(response):
+                        return response
+                if not attempts:
+                    # Nothing succeeded: an error response beats an exception
+                    if responses:
+                        return responses[0]
+                    return done.pop().result()  # Re-raises an attempt's error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def stats(self) -> dict:
+        self._prune(time.monotonic())
+        return {
+            'state': self.state,
+            'requests_in_window': len(self._samples),
+            'error_rate': self.error_rate(),
+            'p95_latency': self.latency_percentile(0.95),
+            'rejected': self.rejected,
+            'hedged': self.hedged,
+        }
+
+
+_guards: dict[str, UpstreamGuard] = {}
+
+
+def get_guard(name: str) -> UpstreamGuard:
+    guard = _guards.get(name)
+    if guard is None:
+        guard = _guards[name] = UpstreamGuard(name)
+    return guard
+
+
+def guard_stats() -> dict:
+    return {name: guard.stats() for name, guard in _guards.items()}
@@ -0,0 +1,72 @@
+"""Backfills the promoted WeatherSearch columns (lat, lon, tempC, feelslikeC,
+condition, locationName) from the weatherData JSON of existing rows, and the
+lower-cased cityKey/countryKey filter columns.
+
+Run once after `prisma db push` adds the columns:
+
+    python scripts/backfill_weather_columns.py [--batch-size 5000]
+
+Rows are updated in id-ordered batches so no single statement holds locks for
+long, and the script can be re-run safely.
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+from prisma import Prisma
+
+# weatherData was historically written via json.dumps, so it may hold a JSON
+# string rather than an object. `#>> '{}'` unwraps either form to text.
+BACKFILL_SQL = '''
+WITH batch AS (
+    SELECT id, ("weatherData" #>> '{}')::jsonb AS wd
+    FROM "WeatherSearch"
+    WHERE id > $1
+    ORDER BY id
+    LIMIT $2
+)
+UPDATE "WeatherSearch" AS ws
+SET "lat"          = COALESCE(ws."lat", (batch.wd #>> '{location,lat}')::double precision),
+    "lon"          = COALESCE(ws."lon", (batch.wd #>> '{location,lon}')::double precision),
+    "tempC"        = COALESCE(ws."tempC", (batch.wd #>> '{current,temp_c}')::double precision),
+    "feelslikeC"   = COALESCE(ws."feelslikeC", (batch.wd #>> '{current,feelslike_c}')::double precision),
+    "condition"    = COALESCE(ws."condition", batch.wd #>> '{current,condition,text}'),
+    "locationName" = COALESCE(ws."locationName", batch.wd #>> '{location,name}'),
+    "cityKey"      = COALESCE(ws."cityKey", lower(ws."city")),
+    "countryKey"   = COALESCE(ws."countryKey", lower(ws."country"))
+FROM batch
+WHERE ws.id = batch.id
+'''
+
+LAST_ID_SQL = '''
+SELECT MAX(id) AS last_id FROM (
+    SELECT id FROM "WeatherSearch" WHERE id > $1 ORDER BY id LIMIT $2
+) AS batch
+'''
+
+
+async def backfill(batch_size: int):
+    db = Prisma()
+    await db.connect()
+    try:
+        last_id = ''
+        total = 0
+        while True:
+            rows = await db.query_raw(LAST_ID_SQL, last_id, batch_size)
+            next_last_id = rows[0]['last_id'] if rows else None
+            if next_last_id is None:
+                break
+            total += await db.execute_raw(BACKFILL_SQL, last_id, batch_size)
+            last_id = next_last_id
+            print(f"Backfilled {total} rows (up to id {last_id})")
+        print(f"Done. {total} rows processed.")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size))
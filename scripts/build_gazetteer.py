@@ -0,0 +1,95 @@
+"""Builds the offline gazetteer for reverse geocoding and autocomplete
+(data/gazetteer.bin) from GeoNames dumps (https://download.geonames.org/export/dump/, CC BY 4.0).
+
+    python scripts/build_gazetteer.py --download             # cities15000 (~26k places)
+    python scripts/build_gazetteer.py --download --cities cities5000
+    python scripts/build_gazetteer.py --source-dir ./geonames # pre-downloaded files
+
+Uses the <cities>.zip, admin1CodesASCII.txt and countryInfo.txt files.
+Re-run it to pick up GeoNames updates; the app only needs the output file.
+"""
+import argparse
+import io
+import os
+import sys
+import urllib.request
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gazetteer import GAZETTEER_PATH, write_gazetteer  # noqa: E402
+
+GEONAMES_URL = "https://download.geonames.org/export/dump/"
+
+
+def read_source(name: str, source_dir: str | None) -> bytes:
+    if source_dir:
+        with open(os.path.join(source_dir, name), "rb") as f:
+            return f.read()
+    print(f"Downloading {GEONAMES_URL}{name}...")
+    with urllib.request.urlopen(GEONAMES_URL + name) as response:
+        return response.read()
+
+
+def load_countries(data: bytes) -> dict[str, str]:
+    countries = {}
+    for line in data.decode("utf-8").splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+        columns = line.split("\t")
+        countries[columns[0]] = columns[4]
+    return countries
+
+
+def load_admin1(data: bytes) -> dict[str, str]:
+    admin1 = {}
+    for line in data.decode("utf-8").splitlines():
+        columns = line.split("\t")
+        if len(columns) >= 2:
+            admin1[columns[0]] = columns[1]
+    return admin1
+
+
+def load_places(archive: bytes, cities: str, admin1: dict, countries: dict) -> list[tuple]:
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        text = zf.read(f"{cities}.txt").decode("utf-8")
+    places = []
+    for line in text.splitlines():
+        columns = line.split("\t")
+        if len(columns) < 15:
+            continue
+        country_code, admin1_code = columns[8], columns[10]
+        places.append((
+            float(columns[4]),
+            float(columns[5]),
+            columns[1],
+            admin1.get(f"{country_code}.{admin1_code}", ""),
+            countries.get(country_code, country_code),
+            int(columns[14] or 0),
+        ))
+    return places
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline reverse-geocoding gazetteer")
+    parser.add_argument("--cities", default="cities15000",
+                        help="GeoNames cities extract: cities500, cities1000, cities5000 or cities15000")
+    parser.add_argument("--download", action="store_true", help="Fetch the source files from GeoNames")
+    parser.add_argument("--source-dir", help="Directory holding already-downloaded GeoNames files")
+    parser.add_argument("--output", default=GAZETTEER_PATH)
+    parser.add_argument("--cell-degrees", type=float, default=1.0, help="Spatial grid cell size")
+    args = parser.parse_args()
+    if not args.download and not args.source_dir:
+        parser.error("pass --download or --source-dir")
+
+    source_dir = None if args.download else args.source_dir
+    countries = load_countries(read_source("countryInfo.txt", source_dir))
+    admin1 = load_admin1(read_source("admin1CodesASCII.txt", source_dir))
+    places = load_places(read_source(f"{args.cities}.zip", source_dir), args.cities, admin1, countries)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    write_gazetteer(args.output, places, args.cell_degrees)
+    print(f"Wrote {len(places)} places to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
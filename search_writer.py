@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+
+from prisma.models import WeatherSearch
+
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+SEARCH_QUEUE_SIZE = int(os.getenv('SEARCH_QUEUE_SIZE', '5000'))
+SEARCH_BATCH_SIZE = int(os.getenv('SEARCH_BATCH_SIZE', '200'))
+SEARCH_FLUSH_INTERVAL = float(os.getenv('SEARCH_FLUSH_INTERVAL', '1.0'))
+# How long a request waits for room in a full queue before its record is dropped
+SEARCH_ENQUEUE_TIMEOUT = float(os.getenv('SEARCH_ENQUEUE_TIMEOUT', '0.5'))
+
+
+class SearchWriteBuffer:
+    """Write-behind buffer for search history.
+
+    Requests enqueue records and return immediately; a background task writes
+    them with create_many once SEARCH_BATCH_SIZE records are waiting or
+    SEARCH_FLUSH_INTERVAL seconds have passed, whichever comes first.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=SEARCH_QUEUE_SIZE)
+        self._task: asyncio.Task | None = None
+        self._batch: list[dict] = []  # Records taken off the queue but not yet flushed
+        self._flushing: asyncio.Task | None = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flusher and writes everything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+        await self._flush(self._batch)
+        while not self._queue.empty():
+            await self._flush(self._take_batch())
+        logger.info(f"Search writer drained ({self.written} written, {self.dropped} dropped, {self.failed} failed).")
+
+    async def enqueue(self, record: dict) -> bool:
+        """Queues a record. Waits briefly when the queue is full (backpressure)
+        and drops the record if no room frees up in time."""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._queue.put(record), timeout=SEARCH_ENQUEUE_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning(f"Search queue full, dropping record for {record.get('city')}.")
+            return False
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _take_batch(self) -> list[dict]:
+        batch = []
+        while len(batch) < SEARCH_BATCH_SIZE and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = [await self._queue.get()]
+            deadline = loop.time() + SEARCH_FLUSH_INTERVAL
+            while len(self._batch) < SEARCH_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Shielded so stop() can't cancel a write halfway; it awaits it instead
+            self._flushing = asyncio.create_task(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush(self, batch: list[dict]):
+        if not batch:
+            return
+        try:
+            with stage_timer("db_write"):
+                self.written += await WeatherSearch.prisma().create_many(data=batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to save {len(batch)} searches to database: {e}")
+
+
+search_writer = SearchWriteBuffer()
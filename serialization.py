@@ -0,0 +1,53 @@
+import orjson
+from fastapi.responses import Response
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def dumps(value) -> bytes:
+    """orjson encoding; handles dataclasses and datetimes natively."""
+    return orjson.dumps(value)
+
+
+def dumps_indented(value) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2)
+
+
+def loads(data: bytes | str):
+    return orjson.loads(data)
+
+
+def extend_object(serialized: bytes, extra: dict) -> bytes:
+    """Appends `extra`'s keys to an already-encoded JSON object without re-encoding it.
+    Keys must not already be present in `serialized`."""
+    if not extra:
+        return serialized
+    tail = orjson.dumps(extra)
+    if serialized == b"{}":
+        return tail
+    return serialized[:-1] + b"," + tail[1:]
+
+
+def embed_raw(fields: dict, raw: dict) -> bytes:
+    """Encodes `fields` plus keys whose values are already-encoded JSON (bytes, or None for null)."""
+    parts = [orjson.dumps(key) + b":" + (value if value is not None else b"null") for key, value in raw.items()]
+    if not parts:
+        return orjson.dumps(fields)
+    head = orjson.dumps(fields)
+    return (head[:-1] + b"," if head != b"{}" else b"{") + b",".join(parts) + b"}"
+
+
+def stored_json(value) -> bytes | None:
+    """Encoded form of a Json column. save_search writes weatherData as a JSON
+    string, which is passed through as-is instead of being parsed and re-encoded."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.encode() if value.lstrip().startswith("{") else None
+    return orjson.dumps(value)
+
+
+def raw_json_response(content: bytes, status_code: int = 200, headers: dict | None = None) -> Response:
+    """Response for a body that is already encoded, skipping FastAPI's jsonable_encoder."""
+    return Response(content=content, status_code=status_code, headers=headers, media_type=JSON_MEDIA_TYPE)
+
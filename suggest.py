@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import math
+import os
+from bisect import bisect_left
+
+import gazetteer
+from cache import TTLCache
+from gazetteer import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_MIN_QUERY_LENGTH = int(os.getenv('SUGGEST_MIN_QUERY_LENGTH', '2'))
+SUGGEST_MAX_RESULTS = int(os.getenv('SUGGEST_MAX_RESULTS', '20'))
+SUGGEST_REFRESH_INTERVAL = float(os.getenv('SUGGEST_REFRESH_INTERVAL', '300'))
+# How many distinct searched locations are kept for suggestions
+SUGGEST_SEARCHED_LIMIT = int(os.getenv('SUGGEST_SEARCHED_LIMIT', '5000'))
+# Relative weight of search popularity vs population (both on a log scale)
+SUGGEST_SEARCH_WEIGHT = float(os.getenv('SUGGEST_SEARCH_WEIGHT', '2.0'))
+SUGGEST_CACHE_SIZE = int(os.getenv('SUGGEST_CACHE_SIZE', '5000'))
+
+SEARCHED_LOCATIONS_SQL = '''
+SELECT city, state, country, COUNT(*)::int AS searches, AVG(lat) AS lat, AVG(lon) AS lon
+FROM "WeatherSearch"
+GROUP BY city, state, country
+ORDER BY searches DESC
+LIMIT $1
+'''
+
+
+def _score(population: int, searches: int) -> float:
+    return math.log10(population + 1) + SUGGEST_SEARCH_WEIGHT * math.log10(searches + 1)
+
+
+def _dedup_key(city: str, state: str | None, country: str) -> str:
+    return "|".join(normalize_text(part) for part in (city, state, country))
+
+
+class LocationSuggester:
+    """Prefix search over the gazetteer's sorted name index plus the locations
+    users have searched, ranked by population and search popularity.
+
+    Everything is answered from memory; the searched locations are re-read
+    from the database every SUGGEST_REFRESH_INTERVAL seconds, and answers are
+    cached per prefix until then.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        # (normalized city, entry) sorted by normalized city, for bisecting
+        self._searched: list[tuple[str, dict]] = []
+        self._search_counts: dict[str, int] = {}
+        self._cache = TTLCache(maxsize=SUGGEST_CACHE_SIZE, ttl=SUGGEST_REFRESH_INTERVAL, name="suggest")
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Refreshing searched locations for suggestions failed: {e}")
+            await asyncio.sleep(SUGGEST_REFRESH_INTERVAL)
+
+    async def refresh(self):
+        rows = await self._db.query_raw(SEARCHED_LOCATIONS_SQL, SUGGEST_SEARCHED_LIMIT)
+        searched = []
+        counts = {}
+        for row in rows:
+            entry = {
+                'city': row['city'],
+                'state': row['state'],
+                'country': row['country'],
+                'lat': row['lat'],
+                'lon': row['lon'],
+                'population': None,
+                'searches': row['searches'],
+            }
+            searched.append((normalize_text(row['city']), entry))
+            counts[_dedup_key(row['city'], row['state'], row['country'])] = row['searches']
+        searched.sort(key=lambda item: item[0])
+        # Swap in one step so concurrent lookups never see a half-built index
+        self._searched, self._search_counts = searched, counts
+        self._cache.clear()
+        logger.debug(f"Suggestion index refreshed with {len(searched)} searched locations.")
+
+    def suggest(self, query: str, limit: int = 8) -> list[dict]:
+        prefix = normalize_text(query)
+        if len(prefix) < SUGGEST_MIN_QUERY_LENGTH:
+            return []
+        key = (prefix, limit)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        candidates: dict[str, dict] = {}
+        offline = gazetteer.load()
+        if offline is not None:
+            # Only the most populous matches can make the cut; searched ones are added below
+            for index in offline.most_populous(prefix, limit):
+                city, state, country = offline.place(index)
+                lat, lon = offline.location(index)
+                candidates[_dedup_key(city, state, country)] = {
+                    'city': city,
+                    'state': state,
+                    'country': country,
+                    'lat': round(lat, 4),
+                    'lon': round(lon, 4),
+                    'population': offline.population(index),
+                    'searches': self._search_counts.get(_dedup_key(city, state, country), 0),
+                }
+
+        searched = self._searched
+        start = bisect_left(searched, prefix, key=lambda item: item[0])
+        for name, entry in searched[start:]:
+            if not name.startswith(prefix):
+                break
+            dedup = _dedup_key(entry['city'], entry['state'], entry['country'])
+            if dedup not in candidates:
+                candidates[dedup] = entry
+
+        ranked = sorted(
+            candidates.values(),
+            key=lambda entry: _score(entry['population'] or 0, entry['searches']),
+            reverse=True
+        )[:limit]
+        self._cache.set(key, ranked)
+        return ranked
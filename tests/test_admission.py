@@ -0,0 +1,84 @@
+import asyncio
+
+from starlette.datastructures import Headers
+
+from admission import LoadMonitor, LoadTrackingMiddleware, background_work, client_id
+
+
+def forwarded(*values: str) -> Headers:
+    return Headers(raw=[(b"x-forwarded-for", value.encode()) for value in values])
+
+
+def test_forged_leftmost_entry_does_not_change_client():
+    honest = client_id(forwarded("203.0.113.7"), "10.0.0.1", hops=1)
+    forged = client_id(forwarded("198.51.100.99, 203.0.113.7"), "10.0.0.1", hops=1)
+    assert honest == forged == "203.0.113.7"
+
+
+def test_entry_is_counted_from_the_right_per_hop():
+    headers = forwarded("198.51.100.99, 203.0.113.7, 10.1.0.5")
+    assert client_id(headers, "10.0.0.1", hops=2) == "203.0.113.7"
+
+
+def test_repeated_headers_are_combined_in_order():
+    headers = forwarded("198.51.100.99", "203.0.113.7")
+    assert client_id(headers, "10.0.0.1", hops=1) == "203.0.113.7"
+
+
+def test_fewer_entries_than_hops_uses_leftmost():
+    assert client_id(forwarded("203.0.113.7"), "10.0.0.1", hops=2) == "203.0.113.7"
+
+
+def test_header_ignored_without_trusted_hops():
+    assert client_id(forwarded("198.51.100.99"), "10.0.0.1", hops=0) == "10.0.0.1"
+    assert client_id(forwarded(), "10.0.0.1", hops=1) == "10.0.0.1"
+
+
+def test_streamed_response_counts_as_in_flight_until_its_body_ends():
+    monitor = LoadMonitor(in_flight_threshold=100, hold_seconds=0)
+    seen = []
+
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for more in (True, False):
+            seen.append(monitor.in_flight)
+            await send({"type": "http.response.body", "body": b"event", "more_body": more})
+
+    async def noop(message):
+        pass
+
+    middleware = LoadTrackingMiddleware(streaming_app, monitor)
+    asyncio.run(middleware({"type": "http", "path": "/api/weather/stream"}, None, noop))
+    assert seen == [1, 1]
+    assert monitor.in_flight == 0
+
+
+def test_other_paths_are_not_counted_as_in_flight():
+    monitor = LoadMonitor(in_flight_threshold=100, hold_seconds=0)
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(monitor.in_flight)
+
+    middleware = LoadTrackingMiddleware(app, monitor)
+    for path in ("/metrics", "/health", "/api/searches"):
+        asyncio.run(middleware({"type": "http", "path": path}, None, None))
+    assert seen == [0, 0, 0]
+
+
+def test_overload_needs_repeated_upstream_sheds():
+    monitor = LoadMonitor(in_flight_threshold=100, hold_seconds=60, shed_threshold=3, shed_window=60)
+    monitor.record_shed("upstream_limit", "youtube")
+    monitor.record_shed("upstream_limit", "youtube")
+    assert not monitor.overloaded()
+    monitor.record_shed("upstream_limit", "google")
+    assert monitor.overloaded()
+
+
+def test_background_and_client_sheds_do_not_trigger_overload():
+    monitor = LoadMonitor(in_flight_threshold=100, hold_seconds=60, shed_threshold=1, shed_window=60)
+    monitor.record_shed("client_rate_limit", "/api/weather")
+    with background_work():
+        monitor.record_shed("upstream_limit", "openrouter")
+    assert not monitor.overloaded()
+    assert monitor.shed[("upstream_limit", "openrouter")] == 1
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import forecast
+from weather_model import transform_weather
+
+CELL = forecast.forecast_cell(48.85, 2.35)
+
+
+def days_from_today(offset: int) -> str:
+    return (datetime.now(timezone.utc).date() + timedelta(days=offset)).isoformat()
+
+
+def history_response(start: str) -> dict:
+    day = {
+        'maxtemp_c': 20.0, 'mintemp_c': 10.0, 'avgtemp_c': 15.0, 'maxwind_kph': 12.0, 'avghumidity': 60,
+        'condition': {'text': 'Sunny', 'icon': 'sun.png'},
+    }
+    return {
+        'location': {'name': 'Paris', 'localtime': '2030-01-01 09:00', 'localtime_epoch': 1},
+        'forecast': {'forecastday': [{'date': start, 'day': day, 'hour': []}]},
+    }
+
+
+def test_past_date_uses_history_endpoint_with_end_date():
+    path, params = forecast.upstream_query(CELL, 5, days_from_today(-30))
+    assert path == forecast.WEATHER_HISTORY_PATH
+    assert params['dt'] == days_from_today(-30)
+    assert params['end_dt'] == days_from_today(-26)
+    assert 'days' not in params
+
+
+def test_history_range_stops_at_yesterday():
+    path, params = forecast.upstream_query(CELL, 5, days_from_today(-2))
+    assert path == forecast.WEATHER_HISTORY_PATH
+    assert params['end_dt'] == days_from_today(-1)
+
+    _, params = forecast.upstream_query(CELL, 5, days_from_today(-1))
+    assert 'end_dt' not in params
+
+
+def test_today_and_later_use_forecast_endpoint():
+    assert forecast.upstream_query(CELL, 5, None) == (
+        forecast.WEATHER_FORECAST_PATH, {'key': forecast.WEATHER_API_KEY, 'q': '48.85,2.35', 'days': 5}
+    )
+    path, params = forecast.upstream_query(CELL, 5, days_from_today(3))
+    assert path == forecast.WEATHER_FORECAST_PATH
+    assert params['dt'] == days_from_today(3)
+
+
+def test_past_date_request_reaches_history_endpoint(monkeypatch):
+    calls = []
+
+    async def fake_request(name, method, path, params):
+        calls.append((name, path, params))
+        return httpx.Response(200, json=history_response(params['dt']), request=httpx.Request(method, path))
+
+    monkeypatch.setattr(forecast, 'upstream_request', fake_request)
+    asyncio.run(forecast.fetch_cell_upstream(CELL, 5, days_from_today(-10)))
+    [(name, path, params)] = calls
+    assert (name, path) == ('weatherapi', forecast.WEATHER_HISTORY_PATH)
+    assert (params['dt'], params['end_dt']) == (days_from_today(-10), days_from_today(-6))
+
+
+def test_history_payload_is_served_without_fetch_time_state():
+    weather_history = pytest.importorskip('weather_history', exc_type=ImportError)  # needs a generated Prisma client
+    payload = weather_history.history_payload({**history_response('2024-03-01'), 'current': {'temp_c': 99}})
+    assert 'current' not in payload
+    assert 'localtime' not in payload['location']
+
+    report = transform_weather(payload, 'Paris', 'IDF', 'France', 48.85, 2.35)
+    assert report.location.localtime == '2024-03-01 00:00'
+    assert report.current.temp_c == 15.0
+    assert report.current.humidity == 60
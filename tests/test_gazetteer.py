@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+import gazetteer
+from gazetteer import Gazetteer, _distance_km, write_gazetteer
+
+
+@pytest.fixture(scope="module", params=[1.0, 5.0])
+def places_and_gazetteer(request, tmp_path_factory):
+    rng = random.Random(15000)
+    places = [
+        (rng.uniform(-89.5, 89.5), rng.uniform(-180, 180), f"Place {i}", "", "XX", rng.randint(0, 10**6))
+        for i in range(3000)
+    ]
+    # Clusters at the antimeridian and near the poles, where wrap-around and
+    # shrinking longitude bounds are easy to get wrong
+    places += [(rng.uniform(-5, 5), rng.choice((-179.9, 179.9)), f"Edge {i}", "", "XX", 1) for i in range(50)]
+    places += [(rng.choice((-88.9, 88.9)), rng.uniform(-180, 180), f"Polar {i}", "", "XX", 1) for i in range(50)]
+    path = tmp_path_factory.mktemp("gazetteer") / "g.bin"
+    write_gazetteer(str(path), places, cell_degrees=request.param)
+    gz = Gazetteer(str(path))
+    yield gz
+    gz.close()
+
+
+def brute_force(gz: Gazetteer, lat: float, lon: float, max_km: float):
+    distances = [_distance_km(lat, lon, *gz.location(index)) for index in range(gz.count)]
+    best = min(range(gz.count), key=distances.__getitem__)
+    return (best, distances[best]) if distances[best] <= max_km else None
+
+
+@pytest.mark.parametrize("max_km", [25.0, 300.0, 5000.0])
+def test_nearest_matches_brute_force(places_and_gazetteer, max_km):
+    gz = places_and_gazetteer
+    rng = random.Random(int(max_km))
+    queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(150)]
+    queries += [(0.0, 179.99), (0.0, -179.99), (89.99, 0.0), (-89.99, 120.0)]
+    for lat, lon in queries:
+        expected = brute_force(gz, lat, lon, max_km)
+        found = gz.nearest(lat, lon, max_km)
+        if expected is None:
+            assert found is None, (lat, lon)
+        else:
+            assert found is not None, (lat, lon)
+            # Ties may resolve to a different index; the distance must match
+            assert found[1] == pytest.approx(expected[1], abs=1e-6), (lat, lon)
+
+
+def test_components_label_the_nearest_place(tmp_path):
+    path = tmp_path / "g.bin"
+    write_gazetteer(str(path), [(48.8566, 2.3522, "Paris", "Ile-de-France", "France", 2_000_000),
+                                (45.764, 4.8357, "Lyon", "", "France", 500_000)])
+    gz = Gazetteer(str(path))
+    try:
+        assert gz.components(48.86, 2.35) == {
+            'locality': 'Paris', 'country': 'France', 'administrative_area_level_1': 'Ile-de-France'
+        }
+        assert gz.components(45.76, 4.84) == {'locality': 'Lyon', 'country': 'France'}
+        assert gz.components(0.0, 0.0) is None
+    finally:
+        gz.close()
+
+
+def test_normalize_text_folds_case_and_accents():
+    assert gazetteer.normalize_text("  São  Paulo ") == gazetteer.normalize_text("sao paulo")
@@ -0,0 +1,131 @@
+import asyncio
+
+import httpx
+import pytest
+
+import llm_dispatcher
+from llm_dispatcher import BACKGROUND, INTERACTIVE, LLMDispatcher, LLMQueueFullError
+
+
+def response(status: int, headers: dict | None = None) -> httpx.Response:
+    return httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://upstream.test/"))
+
+
+def run(test):
+    """Runs test(dispatcher) on a fresh dispatcher and stops its workers afterwards."""
+    async def main():
+        dispatcher = LLMDispatcher(concurrency=1, queue_size=10)
+        try:
+            return await test(dispatcher)
+        finally:
+            await dispatcher.stop()
+    return asyncio.run(main())
+
+
+def test_interactive_prompts_overtake_queued_background_ones():
+    sent = []
+    release = asyncio.Event()
+
+    def sender(name, wait=False):
+        async def send():
+            sent.append(name)
+            if wait:
+                await release.wait()
+            return response(200)
+        return send
+
+    async def test(dispatcher):
+        blocker = asyncio.create_task(dispatcher.submit("blocker", sender("blocker", wait=True)))
+        await asyncio.sleep(0)
+        background = asyncio.create_task(dispatcher.submit("prefetch", sender("prefetch"), BACKGROUND))
+        interactive = asyncio.create_task(dispatcher.submit("user", sender("user"), INTERACTIVE))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, background, interactive)
+
+    run(test)
+    assert sent == ["blocker", "user", "prefetch"]
+
+
+def test_identical_pending_prompts_are_sent_once():
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return response(200)
+
+    async def test(dispatcher):
+        results = await asyncio.gather(*(dispatcher.submit("same prompt", send) for _ in range(3)))
+        return dispatcher, results
+
+    dispatcher, results = run(test)
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert dispatcher.counts['deduplicated'] == 2
+
+
+def test_rate_limited_prompt_is_retried_after_retry_after():
+    replies = [response(429, {"retry-after": "0"}), response(200)]
+
+    async def send():
+        return replies.pop(0)
+
+    async def test(dispatcher):
+        return dispatcher, await dispatcher.submit("prompt", send)
+
+    dispatcher, result = run(test)
+    assert result.status_code == 200
+    assert dispatcher.counts['rate_limited'] == 1
+    assert dispatcher.counts['sent'] == 2
+
+
+def test_rate_limit_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(llm_dispatcher, 'LLM_MAX_RETRIES', 1)
+
+    async def send():
+        return response(429, {"retry-after": "0"})
+
+    async def test(dispatcher):
+        return await dispatcher.submit("prompt", send)
+
+    assert run(test).status_code == 429
+
+
+def test_full_queue_refuses_new_prompts():
+    release = asyncio.Event()
+
+    async def send():
+        await release.wait()
+        return response(200)
+
+    async def test(dispatcher):
+        dispatcher.queue_size = 1
+        pending = asyncio.create_task(dispatcher.submit("first", send))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMQueueFullError):
+            await dispatcher.submit("second", send)
+        release.set()
+        await pending
+
+    run(test)
+
+
+def test_response_handler_runs_after_every_caller_gave_up():
+    handled = []
+
+    async def send():
+        await asyncio.sleep(0.05)
+        return response(200)
+
+    async def on_response(reply):
+        handled.append(reply.status_code)
+
+    async def test(dispatcher):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(dispatcher.submit("slow", send, on_response=on_response), timeout=0.01)
+        await asyncio.sleep(0.1)
+
+    run(test)
+    assert handled == [200]
@@ -0,0 +1,143 @@
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+import resilience
+from admission import UpstreamLimiter
+from resilience import CircuitOpenError, UpstreamGuard
+
+
+def response(status: int) -> httpx.Response:
+    return httpx.Response(status, request=httpx.Request("GET", "https://upstream.test/"))
+
+
+def warmed_guard(name: str = "test") -> UpstreamGuard:
+    """A closed guard with enough fast samples for hedging to kick in."""
+    guard = UpstreamGuard(name)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        guard.record(0.001, ok=True)
+    return guard
+
+
+def test_circuit_opens_on_errors_and_fails_fast(monkeypatch):
+    monkeypatch.setattr(resilience, 'CIRCUIT_MIN_REQUESTS', 4)
+    guard = UpstreamGuard("test")
+
+    async def failing():
+        return response(503)
+
+    async def run():
+        for _ in range(4):
+            await guard.call(failing)
+        with pytest.raises(CircuitOpenError):
+            await guard.call(failing)
+
+    asyncio.run(run())
+    assert guard.state == resilience.OPEN
+    assert guard.rejected == 1
+
+
+def test_rate_limited_responses_do_not_open_the_circuit(monkeypatch):
+    monkeypatch.setattr(resilience, 'CIRCUIT_MIN_REQUESTS', 4)
+    guard = UpstreamGuard("test")
+
+    async def rate_limited():
+        return response(429)
+
+    async def run():
+        for _ in range(10):
+            await guard.call(rate_limited)
+
+    asyncio.run(run())
+    assert guard.state == resilience.CLOSED
+
+
+def test_half_open_probe_is_released_when_it_raises_unexpectedly(monkeypatch):
+    monkeypatch.setattr(resilience, 'CIRCUIT_OPEN_SECONDS', 0)
+    guard = UpstreamGuard("test")
+    guard._open(0)
+
+    async def broken():
+        raise ValueError("bug in our code")
+
+    async def healthy():
+        return response(200)
+
+    async def run():
+        with pytest.raises(ValueError):
+            await guard.call(broken)
+        assert guard.allow()  # Another probe may go out
+        guard._probe_in_flight = False
+        await guard.call(healthy)
+
+    asyncio.run(run())
+    assert guard.state == resilience.CLOSED
+
+
+def test_hedge_wins_when_both_attempts_finish_together():
+    guard = warmed_guard()
+    release = asyncio.Event()
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await release.wait()
+            raise httpx.ConnectError("primary failed")
+        # Wakes the primary in the same loop iteration as this hedge
+        asyncio.get_running_loop().call_soon(release.set)
+        await release.wait()
+        return response(200)
+
+    result = asyncio.run(guard.call(send, hedge=True))
+    assert result.status_code == 200
+    assert guard.hedged == 1
+
+
+def test_error_response_preferred_over_exception_when_nothing_succeeds():
+    guard = warmed_guard()
+    release = asyncio.Event()
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await release.wait()
+            raise httpx.ConnectError("primary failed")
+        asyncio.get_running_loop().call_soon(release.set)
+        await release.wait()
+        return response(502)
+
+    assert asyncio.run(guard.call(send, hedge=True)).status_code == 502
+
+
+def test_hedge_does_not_exceed_upstream_concurrency(monkeypatch):
+    limiter = UpstreamLimiter("google", limit=1, queue_timeout=1.0)
+    active = peak = calls = 0
+
+    async def handler(request):
+        nonlocal active, peak, calls
+        calls += 1
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.2)
+        active -= 1
+        return httpx.Response(200)
+
+    monkeypatch.setattr(http_client, '_limiters', {"google": limiter})
+    monkeypatch.setattr(resilience, '_guards', {"google": warmed_guard("google")})
+
+    async def run():
+        monkeypatch.setitem(http_client._clients, "google", httpx.AsyncClient(
+            base_url="https://upstream.test", transport=httpx.MockTransport(handler)
+        ))
+        return await http_client.request("google", "GET", "/maps/api/geocode/json")
+
+    assert asyncio.run(run()).status_code == 200
+    assert (calls, peak) == (1, 1)
+    assert resilience._guards["google"].hedged == 1
+    assert limiter.active == 0
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from prisma import Json
+from prisma.models import WeatherHistory
+
+from cache import SingleFlight, make_cache
+from forecast import fetch_cell_upstream, forecast_cell
+
+logger = logging.getLogger(__name__)
+
+# Past dates never change, so the DB copy is kept forever; memory is just a hot tier.
+HISTORY_MEMORY_TTL = float(os.getenv('HISTORY_MEMORY_TTL', str(7 * 24 * 3600)))
+HISTORY_CACHE_SIZE = int(os.getenv('HISTORY_CACHE_SIZE', '2000'))
+HISTORY_BACKFILL_CONCURRENCY = int(os.getenv('HISTORY_BACKFILL_CONCURRENCY', '4'))
+HISTORY_BACKFILL_MAX_DAYS = int(os.getenv('HISTORY_BACKFILL_MAX_DAYS', '366'))
+
+_memory = make_cache(maxsize=HISTORY_CACHE_SIZE, ttl=HISTORY_MEMORY_TTL, name="history")
+_flights = SingleFlight(_memory)
+
+
+def is_past_date(dt: str | None) -> bool:
+    """True if `dt` is over everywhere on Earth (before yesterday in UTC),
+    which makes its weather immutable."""
+    if not dt:
+        return False
+    try:
+        day = date.fromisoformat(dt)
+    except ValueError:
+        return False
+    return day < datetime.now(timezone.utc).date() - timedelta(days=1)
+
+
+def _cell_id(lat: float, lon: float) -> str:
+    row, col = forecast_cell(lat, lon)
+    return f"{row}:{col}"
+
+
+async def _load_stored(cell: str, dt: str, days: int) -> dict | None:
+    try:
+        record = await WeatherHistory.prisma().find_unique(
+            where={'cell_date_days': {'cell': cell, 'date': dt, 'days': days}}
+        )
+    except Exception as e:
+        logger.error(f"Error reading weather history for {cell} on {dt}: {e}")
+        return None
+    return record.payload if record else None
+
+
+async def _store(cell: str, dt: str, days: int, payload: dict):
+    try:
+        await WeatherHistory.prisma().upsert(
+            where={'cell_date_days': {'cell': cell, 'date': dt, 'days': days}},
+            data={
+                'create': {'cell': cell, 'date': dt, 'days': days, 'payload': Json(payload)},
+                'update': {},
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error storing weather history for {cell} on {dt}: {e}")
+
+
+def history_payload(data: dict) -> dict:
+    """The parts of a WeatherAPI payload that hold for a past date: the days and
+    the place. `current` and the local time describe the moment it was fetched."""
+    location = {key: value for key, value in data['location'].items() if not key.startswith('localtime')}
+    return {'location': location, 'forecast': {'forecastday': data['forecast']['forecastday']}}
+
+
+async def fetch_history(lat: float, lon: float, dt: str, days: int = 5) -> dict:
+    """WeatherAPI history payload for a past date (see history_payload). Fetched
+    upstream once per grid cell, then served from memory or the WeatherHistory table forever."""
+    cell = _cell_id(lat, lon)
+    key = (cell, dt, days)
+    cached = await _memory.get(key)
+    if cached is not None:
+        return cached
+
+    async def load():
+        payload = await _load_stored(cell, dt, days)
+        if payload is None:
+            payload = history_payload(await fetch_cell_upstream(forecast_cell(lat, lon), days, dt))
+            await _store(cell, dt, days, payload)
+        else:
+            # Rows stored before payloads were trimmed still carry `current`
+            payload = history_payload(payload)
+        await _memory.set(key, payload)
+        return payload
+
+    return await _flights.do(key, load)
+
+
+async def backfill_history(lat: float, lon: float, start: date, end: date, days: int = 5,
+                           concurrency: int = HISTORY_BACKFILL_CONCURRENCY) -> dict:
+    """Fills every past date in [start, end] for a location. Dates already stored
+    cost a DB read only. Returns counts of fetched/failed dates."""
+    last_past_day = datetime.now(timezone.utc).date() - timedelta(days=2)
+    end = min(end, last_past_day)
+    dates = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = []
+
+    async def fill(day: date):
+        async with semaphore:
+            try:
+                await fetch_history(lat, lon, day.isoformat(), days)
+            except Exception as e:
+                logger.error(f"History backfill failed for {day}: {e}")
+                failed.append(day.isoformat())
+
+    await asyncio.gather(*(fill(day) for day in dates))
+    return {'requested': len(dates), 'failed': sorted(failed)}
+
+
+def cache_stats() -> dict:
+    return _memory.stats()
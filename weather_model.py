@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+
+# Slotted dataclasses mirror the JSON shape the frontend reads. orjson encodes
+# them directly, in field order, so no intermediate dicts are built per request.
+
+
+@dataclass(slots=True)
+class Condition:
+    text: str
+    icon: str
+
+
+@dataclass(slots=True)
+class Location:
+    name: str
+    region: str
+    country: str
+    lat: float
+    lon: float
+    localtime: str
+
+
+@dataclass(slots=True)
+class Current:
+    temp_c: float
+    condition: Condition
+    wind_kph: float
+    humidity: int
+    feelslike_c: float
+
+
+@dataclass(slots=True)
+class DaySummary:
+    maxtemp_c: float
+    mintemp_c: float
+    condition: Condition
+    daily_chance_of_rain: int | None = None
+
+
+@dataclass(slots=True)
+class ForecastDay:
+    date: str
+    day: DaySummary
+
+
+@dataclass(slots=True)
+class Forecast:
+    forecastday: list[ForecastDay]
+
+
+@dataclass(slots=True)
+class WeatherReport:
+    location: Location
+    current: Current
+    forecast: Forecast
+
+    def today(self) -> DaySummary | None:
+        return self.forecast.forecastday[0].day if self.forecast.forecastday else None
+
+
+def _condition(raw: dict) -> Condition:
+    return Condition(text=raw['text'], icon=raw['icon'])
+
+
+def _current_from_day(forecastday: dict) -> dict:
+    """A `current` block made from a past day's summary (history.json has none)."""
+    day = forecastday['day']
+    return {
+        'temp_c': day['avgtemp_c'],
+        'condition': day['condition'],
+        'wind_kph': day['maxwind_kph'],
+        'humidity': day['avghumidity'],
+        'feelslike_c': day['avgtemp_c'],
+    }
+
+
+def transform_weather(weather_data: dict, name: str, region: str, country: str,
+                      lat: float, lon: float) -> WeatherReport:
+    """Builds the response model from a raw WeatherAPI forecast.json payload, or
+    a history payload without `current` and `localtime`, which are then taken
+    from the first day. The location is labelled by our own geocoding, not WeatherAPI's."""
+    days = weather_data['forecast']['forecastday']
+    current = weather_data.get('current') or _current_from_day(days[0])
+    localtime = weather_data['location'].get('localtime') or f"{days[0]['date']} 00:00"
+    return WeatherReport(
+        location=Location(
+            name=name,
+            region=region,
+            country=country,
+            lat=lat,
+            lon=lon,
+            localtime=localtime
+        ),
+        current=Current(
+            temp_c=current['temp_c'],
+            condition=_condition(current['condition']),
+            wind_kph=current['wind_kph'],
+            humidity=current['humidity'],
+            feelslike_c=current['feelslike_c']
+        ),
+        forecast=Forecast(forecastday=[
+            ForecastDay(
+                date=day['date'],
+                day=DaySummary(
+                    maxtemp_c=day['day']['maxtemp_c'],
+                    mintemp_c=day['day']['mintemp_c'],
+                    condition=_condition(day['day']['condition']),
+                    daily_chance_of_rain=day['day'].get('daily_chance_of_rain')
+                )
+            )
+            for day in days
+        ])
+    )
@@ -73,6 +73,9 @@ export default function WeatherDashboard() {
   // Search history state
   const [searchHistory, setSearchHistory] = useState([])
   const [historyLoading, setHistoryLoading] = useState(false)
+  // Cursor for the next page of history (the API pages newest-first, 50 at a time)
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null)
+  const [historyLoadingMore, setHistoryLoadingMore] = useState(false)
 
   // Google Maps state
   const [mapsLoaded, setMapsLoaded] = useState(false)
@@ -129,6 +132,7 @@ export default function WeatherDashboard() {
       }
       const data = await response.json()
       setSearchHistory(data)
+      setHistoryCursor(response.headers.get("X-Next-Cursor"))
     } catch (err) {
       console.error("Error fetching search history:", err)
     } finally {
@@ -136,6 +140,24 @@ export default function WeatherDashboard() {
     }
   }
 
+  const fetchMoreSearchHistory = async () => {
+    if (!historyCursor) return
+    try {
+      setHistoryLoadingMore(true)
+      const response = await fetch(`http://localhost:8000/api/searches?cursor=${encodeURIComponent(historyCursor)}`)
+      if (!response.ok) {
+        throw new Error("Failed to fetch more search history")
+      }
+      const data = await response.json()
+      setSearchHistory((prev) => [...prev, ...data] as any)
+      setHistoryCursor(response.headers.get("X-Next-Cursor"))
+    } catch (err) {
+      console.error("Error fetching more search history:", err)
+    } finally {
+      setHistoryLoadingMore(false)
+    }
+  }
+
   const loadGoogleMapsApi = () => {
     if ((window as any).google?.maps || document.querySelector('script[src*="maps.googleapis.com"]')) {
       setMapsLoaded(true)
@@ -638,6 +660,9 @@ export default function WeatherDashboard() {
         onClose={() => setHistoryDialogOpen(false)}
         history={searchHistory}
         loading={historyLoading}
+        hasMore={historyCursor !== null}
+        loadingMore={historyLoadingMore}
+        onLoadMore={fetchMoreSearchHistory}
         onViewItem={handleViewHistoryItem}
         onDeleteItem={handleDeleteHistoryItem}
         onEditItem={handleEditHistoryItem}
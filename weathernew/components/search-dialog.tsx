@@ -4,6 +4,12 @@ import { useState, useEffect } from "react"
 import { Search, MapPin, X } from "lucide-react"
 import ErrorAlert from "./error-alert"
 
+interface LocationSuggestion {
+  city: string
+  state: string
+  country: string
+}
+
 interface SearchDialogProps {
   open: boolean
   onClose: () => void
@@ -23,6 +29,8 @@ export default function SearchDialog({ open, onClose, onSearch, onUseMyLocation,
   const [country, setCountry] = useState("")
   const [date, setDate] = useState("")
   const [error, setError] = useState("")
+  const [suggestions, setSuggestions] = useState<LocationSuggestion[]>([])
+  const [showSuggestions, setShowSuggestions] = useState(false)
 
   // Extract primitive values from initialData, providing defaults
   const initialCity = initialData?.city ?? "";
@@ -43,6 +51,13 @@ export default function SearchDialog({ open, onClose, onSearch, onUseMyLocation,
     onClose()
   }
 
+  const handleSelectSuggestion = (suggestion: LocationSuggestion) => {
+    setCity(suggestion.city)
+    setState(suggestion.state)
+    setCountry(suggestion.country)
+    setShowSuggestions(false)
+  }
+
   const handleUseMyLocation = () => {
     onUseMyLocation()
   }
@@ -69,6 +84,32 @@ export default function SearchDialog({ open, onClose, onSearch, onUseMyLocation,
   // Use the extracted primitive values in the dependency array
   }, [open, initialCity, initialState, initialCountry, initialDate]);
 
+  // Debounced autocomplete so only known locations reach the geocoder
+  useEffect(() => {
+    if (!showSuggestions || city.trim().length < 2) {
+      setSuggestions([])
+      return
+    }
+    const controller = new AbortController()
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `http://localhost:8000/api/locations/suggest?q=${encodeURIComponent(city.trim())}&limit=6`,
+          { signal: controller.signal }
+        )
+        if (response.ok) {
+          setSuggestions(await response.json())
+        }
+      } catch {
+        // Suggestions are best-effort; typing still works without them
+      }
+    }, 150)
+    return () => {
+      clearTimeout(timer)
+      controller.abort()
+    }
+  }, [city, showSuggestions]);
+
   if (!open) return null
 
   return (
@@ -87,7 +128,7 @@ export default function SearchDialog({ open, onClose, onSearch, onUseMyLocation,
         <div className="p-6">
           <form onSubmit={handleSubmit} className="space-y-4">
             <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
-              <div>
+              <div className="relative">
                 <label htmlFor="city" className="block text-sm font-medium text-gray-700 dark:text-gray-300 mb-1">
                   City *
                 </label>
@@ -95,10 +136,37 @@ export default function SearchDialog({ open, onClose, onSearch, onUseMyLocation,
                   id="city"
                   type="text"
                   value={city}
-                  onChange={(e) => setCity(e.target.value)}
+                  onChange={(e) => {
+                    setCity(e.target.value)
+                    setShowSuggestions(true)
+                  }}
+                  onBlur={() => setShowSuggestions(false)}
+                  autoComplete="off"
                   className="w-full px-3 py-2 bg-white dark:bg-gray-800 border border-gray-300 dark:border-gray-600 rounded-md shadow-sm focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-blue-500 text-gray-900 dark:text-white"
                   required
                 />
+                {showSuggestions && suggestions.length > 0 && (
+                  <ul className="absolute z-10 mt-1 w-64 max-h-60 overflow-auto bg-white dark:bg-gray-800 border border-gray-200 dark:border-gray-700 rounded-md shadow-lg">
+                    {suggestions.map((suggestion) => (
+                      <li key={`${suggestion.city}|${suggestion.state}|${suggestion.country}`}>
+                        <button
+                          type="button"
+                          // mousedown fires before the input's blur hides the list
+                          onMouseDown={(e) => {
+                            e.preventDefault()
+                            handleSelectSuggestion(suggestion)
+                          }}
+                          className="w-full text-left px-3 py-2 text-sm hover:bg-gray-100 dark:hover:bg-gray-700 text-gray-900 dark:text-white"
+                        >
+                          {suggestion.city}
+                          <span className="text-gray-500 dark:text-gray-400">
+                            {[""].concat([suggestion.state, suggestion.country].filter(Boolean)).join(", ")}
+                          </span>
+                        </button>
+                      </li>
+                    ))}
+                  </ul>
+                )}
               </div>
 
               <div>
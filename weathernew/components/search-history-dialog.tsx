@@ -9,6 +9,9 @@ interface SearchHistoryDialogProps {
   onClose: () => void
   history: any[]
   loading: boolean
+  hasMore?: boolean
+  loadingMore?: boolean
+  onLoadMore?: () => void
   onViewItem: (id: string) => void
   onDeleteItem: (id: string) => void
   onEditItem: (item: any) => void
@@ -20,6 +23,9 @@ export default function SearchHistoryDialog({
   onClose,
   history,
   loading,
+  hasMore = false,
+  loadingMore = false,
+  onLoadMore,
   onViewItem,
   onDeleteItem,
   onEditItem,
@@ -158,6 +164,18 @@ export default function SearchHistoryDialog({
               ))}
             </ul>
           )}
+
+          {!loading && hasMore && onLoadMore && (
+            <div className="flex justify-center pt-4">
+              <button
+                onClick={onLoadMore}
+                disabled={loadingMore}
+                className="px-4 py-2 text-sm bg-gray-100 hover:bg-gray-200 dark:bg-gray-800 dark:hover:bg-gray-700 text-gray-800 dark:text-white rounded-md transition-colors disabled:opacity-50"
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            </div>
+          )}
         </div>
 
         <div className="p-4 border-t border-gray-200 dark:border-gray-700 flex justify-end">
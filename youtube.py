@@ -0,0 +1,178 @@
+import logging
+import os
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from cache import SharedCache, SingleFlight, make_cache
+from gazetteer import normalize_text
+from http_client import request as upstream_request
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
+YOUTUBE_SEARCH_PATH = "/youtube/v3/search"
+
+# "travel guide {city}" results change over days, not minutes
+YOUTUBE_CACHE_TTL = float(os.getenv('YOUTUBE_CACHE_TTL', str(3 * 24 * 3600)))
+# Empty results are re-checked sooner in case videos appear
+YOUTUBE_NEGATIVE_TTL = float(os.getenv('YOUTUBE_NEGATIVE_TTL', str(6 * 3600)))
+# Expired entries are kept this long so they can be served stale when quota runs low
+YOUTUBE_STALE_RETENTION = float(os.getenv('YOUTUBE_STALE_RETENTION', str(14 * 24 * 3600)))
+YOUTUBE_CACHE_SIZE = int(os.getenv('YOUTUBE_CACHE_SIZE', '5000'))
+
+# Data API quota: 10,000 units/day by default, search.list costs 100 units
+YOUTUBE_DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000'))
+YOUTUBE_QUOTA_RESERVE = int(os.getenv('YOUTUBE_QUOTA_RESERVE', '1000'))
+YOUTUBE_SEARCH_COST = 100
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles") # YouTube quotas reset at midnight Pacific
+# A day's counter outlives the day, whatever the offset between us and Pacific time
+QUOTA_COUNTER_TTL = 2 * 24 * 3600
+
+_cache = make_cache(maxsize=YOUTUBE_CACHE_SIZE, ttl=YOUTUBE_STALE_RETENTION, name="youtube")
+_flights = SingleFlight(_cache)
+
+
+class QuotaTracker:
+    """YouTube units spent today. With the shared cache backend the count is
+    kept there, so every worker on the host draws on the one daily budget;
+    with per-process caches each of the WEB_CONCURRENCY workers gets an equal
+    share of it instead."""
+
+    def __init__(self, counter, daily_quota: int, reserve: int):
+        self._counter = counter
+        self.daily_quota = daily_quota
+        self.reserve = reserve
+        self.used = 0  # As of this worker's last check, for metrics
+        self._day = self._today()
+
+    @staticmethod
+    def _today():
+        return datetime.now(QUOTA_TIMEZONE).date()
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.used = 0
+
+    def _key(self) -> str:
+        self._roll_over()
+        return f"units:{self._day.isoformat()}"
+
+    async def can_spend(self, units: int) -> bool:
+        # peek: counter reads aren't cache lookups and mustn't show up in hit ratios
+        self.used = await self._counter.peek(self._key()) or 0
+        return self.used + units <= self.daily_quota - self.reserve
+
+    async def spend(self, units: int):
+        used = await self._counter.incr(self._key(), units, QUOTA_COUNTER_TTL)
+        self.used = used if used is not None else self.used + units
+
+    async def exhaust(self):
+        """Called when YouTube itself reports the quota as exceeded."""
+        await self._counter.set(self._key(), self.daily_quota, QUOTA_COUNTER_TTL)
+        self.used = self.daily_quota
+
+    def remaining(self) -> int:
+        self._roll_over()
+        return max(0, self.daily_quota - self.used)
+
+
+def _quota_budget(counter) -> tuple[int, int]:
+    """Daily quota and reserve for this worker."""
+    if isinstance(counter, SharedCache):
+        return YOUTUBE_DAILY_QUOTA, YOUTUBE_QUOTA_RESERVE
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    return YOUTUBE_DAILY_QUOTA // workers, YOUTUBE_QUOTA_RESERVE // workers
+
+
+# Kept apart from the video cache so pruning that one can never drop the count;
+# it's state, not a cache, so it stays out of the cache metrics
+_quota_counter = make_cache(maxsize=4, ttl=QUOTA_COUNTER_TTL, name="youtube_quota", register=False)
+quota = QuotaTracker(_quota_counter, *_quota_budget(_quota_counter))
+
+
+def _is_fresh(entry: dict) -> bool:
+    ttl = YOUTUBE_CACHE_TTL if entry['videos'] else YOUTUBE_NEGATIVE_TTL
+    return time.time() - entry['fetched_at'] < ttl
+
+
+async def _search(location_name: str, max_results: int) -> list[dict]:
+    # Construct search query (you can customize this)
+    search_query = f"travel guide {location_name}"
+    params = {
+        "part": "snippet",
+        "q": search_query,
+        "key": YOUTUBE_API_KEY,
+        "maxResults": max_results,
+        "type": "video",
+        "order": "relevance"
+    }
+
+    logger.debug(f"Requesting YouTube Videos for query: {search_query}")
+    await quota.spend(YOUTUBE_SEARCH_COST)
+    response = await upstream_request("youtube", "GET", YOUTUBE_SEARCH_PATH, params=params)
+    response.raise_for_status() # Raise HTTP errors
+    data = response.json()
+
+    videos = []
+    for item in data.get('items', []):
+        if item.get('id', {}).get('videoId'): # Check if it's a video result
+            snippet = item.get('snippet', {})
+            videos.append({
+                'videoId': item['id']['videoId'],
+                'title': snippet.get('title'),
+                'thumbnailUrl': snippet.get('thumbnails', {}).get('default', {}).get('url')
+            })
+    logger.debug(f"Found {len(videos)} YouTube videos for '{location_name}'")
+    return videos
+
+
+async def _refresh(key, location_name: str, max_results: int) -> dict:
+    entry = {'videos': await _search(location_name, max_results), 'fetched_at': time.time()}
+    await _cache.set(key, entry)
+    return entry
+
+
+async def fetch_youtube_videos(location_name: str, max_results: int = 3) -> list[dict]:
+    """Travel videos for a location. Served from cache while fresh; live lookups
+    only happen while the daily quota allows, otherwise stale results are used."""
+    if not YOUTUBE_API_KEY:
+        logger.warning("YouTube API Key not configured. Skipping video search.")
+        return []
+    if not location_name:
+        logger.warning("No location name provided for YouTube search. Skipping.")
+        return []
+
+    key = (normalize_text(location_name), max_results)
+    entry = await _cache.get(key)
+    if entry is not None and _is_fresh(entry):
+        return entry['videos']
+    stale = entry['videos'] if entry is not None else []
+
+    if not await quota.can_spend(YOUTUBE_SEARCH_COST):
+        logger.warning(f"YouTube quota nearly exhausted ({quota.remaining()} units left). Serving cached videos.")
+        return stale
+
+    try:
+        # Callers waiting on another worker's search may get the stale entry back
+        videos = (await _flights.do(key, lambda: _refresh(key, location_name, max_results)))['videos']
+    except httpx.RequestError as e:
+        logger.error(f"Error fetching YouTube API: {e}")
+        return stale # Fall back to stale results on network/request error
+    except httpx.HTTPStatusError as e:
+        logger.error(f"YouTube API returned error: {e.response.status_code} - {e.response.text}")
+        if e.response.status_code == 403 and 'quota' in e.response.text.lower():
+            await quota.exhaust()
+        return stale
+    except Exception as e:
+        logger.error(f"Error processing YouTube response: {e}")
+        return stale
+    return videos
+
+
+def cache_stats() -> dict:
+    return {**_cache.stats(), 'quota_used': quota.used, 'quota_remaining': quota.remaining()}